@@ -1,15 +1,19 @@
 from __future__ import annotations
-import os, json, pickle, sqlite3, re, math, time
+import os, json, pickle, sqlite3, re, math, time, datetime, bisect, threading, zlib, hashlib
+from collections import OrderedDict
 from typing import List, Optional, Dict, Any, Tuple
 from fastapi import FastAPI, Query, HTTPException, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-import joblib
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from scipy import sparse
 
 ART_DIR = os.environ.get("ARTIFACTS_DIR", "artifacts")
 DB_PATH = os.environ.get("EVENTS_DB", "db/events.sqlite")
 API_KEY  = os.environ.get("API_KEY")  # optional simple auth for mutating endpoints
+WARM_RECS = os.environ.get("WARM_RECS", "1") != "0"  # precompute /v1/recommend at load time
+RETAIN_DAYS = int(os.environ.get("EVENTS_RETAIN_DAYS", "90"))  # raw events older than this are compacted
+SERVING_MODE = os.environ.get("SERVING_MODE", "full")  # "full" (joblib/pickle) or "lite" (NumPy/SciPy only)
 
 app = FastAPI(title="Protocol Companion API", version="1.0")
 
@@ -29,19 +33,129 @@ STATE: Dict[str, Any] = {
     "bm25": None,
     "meta": None,           # list of chunks metadata
     "chunks": None,         # list of chunk texts (aligned with meta)
-    "protocols": None       # list of curated protocol cards
+    "protocols": None,      # list of curated protocol cards
+    "version": None,        # artifact content hash (keys user_vector rows)
+    "recs_version": None,   # version + TF-IDF matrix hash (keys artifacts/recs.json)
+    "recs": {},             # canonical tag set -> (chunk indices, scores)
+    "protocol_vecs": {},    # protocol slug -> TF-IDF row of the card text
+    "suggest": None,        # typeahead prefix index (SuggestIndex)
+    "evidence": {},         # protocol slug -> [(chunk row, score)] from protocol_evidence.json
+    "protocol_sources": {}, # protocol slug -> {"episode_id", "chunk_index"} served as /v1/next source
+    "users": OrderedDict()  # user_id -> cached preferences (LRU)
 }
 
+# ---- Lightweight serving (NumPy/SciPy only) ----
+class LiteVectorizer:
+    """Reproduces TfidfVectorizer.transform from the plain artifacts written by build_indices."""
+    def __init__(self, vocab: List[str], idf: np.ndarray, settings: Dict[str, Any]):
+        self.vocabulary_ = {t: j for j, t in enumerate(vocab)}
+        self.idf_ = idf
+        self.lowercase = settings["lowercase"]
+        self.token_re = re.compile(settings["token_pattern"])
+        self.ngram_range = tuple(settings["ngram_range"])
+        self.norm = settings["norm"]
+        self.sublinear_tf = settings["sublinear_tf"]
+
+    @classmethod
+    def load(cls, art_dir: str) -> "LiteVectorizer":
+        cfg = json.load(open(os.path.join(art_dir, "tfidf_lite.json"), "r", encoding="utf-8"))
+        return cls(cfg["vocab"], np.load(os.path.join(art_dir, "tfidf_idf.npy")), cfg["settings"])
+
+    def _terms(self, doc: str):
+        toks = self.token_re.findall(doc.lower() if self.lowercase else doc)
+        lo, hi = self.ngram_range
+        for n in range(lo, hi+1):
+            for i in range(len(toks)-n+1):
+                yield toks[i] if n == 1 else " ".join(toks[i:i+n])
+
+    def transform(self, docs: List[str]):
+        indptr, indices = [0], []
+        for doc in docs:
+            indices.extend(j for j in map(self.vocabulary_.get, self._terms(doc)) if j is not None)
+            indptr.append(len(indices))
+        X = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(docs), len(self.idf_)))
+        X.sum_duplicates()
+        if self.sublinear_tf: X.data = np.log(X.data) + 1
+        X.data *= self.idf_[X.indices]
+        return l2_normalize(X) if self.norm == "l2" else X
+
+class LiteBM25:
+    """BM25Okapi.get_scores over precomputed per-posting weights (docs x terms, CSC)."""
+    def __init__(self, weights, vocab: List[str]):
+        self.weights = weights
+        self.vocab = {t: j for j, t in enumerate(vocab)}
+
+    @classmethod
+    def load(cls, art_dir: str) -> "LiteBM25":
+        vocab = json.load(open(os.path.join(art_dir, "bm25_vocab.json"), "r", encoding="utf-8"))
+        return cls(sparse.load_npz(os.path.join(art_dir, "bm25.npz")).tocsc(), vocab)
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        cols = [self.vocab[q] for q in query if q in self.vocab]
+        if not cols: return np.zeros(self.weights.shape[0])
+        return np.asarray(self.weights[:, cols].sum(axis=1), dtype=np.float64).ravel()
+
+def l2_normalize(X):
+    X = sparse.csr_matrix(X, dtype=np.result_type(X.dtype, np.float32))
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    X.data /= np.repeat(norms, np.diff(X.indptr)).astype(X.dtype)
+    return X
+
+def cosine_scores(query_vec, doc_mat) -> np.ndarray:
+    """Cosine similarity of one query row against the (L2-normalised) TF-IDF rows."""
+    q = l2_normalize(query_vec).toarray().ravel()
+    return np.asarray(doc_mat @ q, dtype=np.float64).ravel()
+
+# ---- Typeahead ----
+SUGGEST_CACHE_LEN = 2   # prefixes up to this length are answered from a precomputed top list
+SUGGEST_MAX = 20
+
+class SuggestIndex:
+    """Sorted key array from artifacts/suggest.json; a prefix is a contiguous key range."""
+    def __init__(self, data: Dict[str, List[Any]]):
+        self.keys, self.text, self.kind, self.weight = data["keys"], data["text"], data["kind"], data["weight"]
+        # Short prefixes match large ranges, so keep their best entries ready
+        self.top: Dict[str, List[int]] = {}
+        for n in range(1, SUGGEST_CACHE_LEN+1):
+            groups: Dict[str, List[int]] = {}
+            for i, k in enumerate(self.keys):
+                if len(k) >= n: groups.setdefault(k[:n], []).append(i)
+            for p, idx in groups.items():
+                self.top[p] = self._best(idx, SUGGEST_MAX)
+
+    def _best(self, idx, limit: int) -> List[int]:
+        out, seen = [], set()
+        for i in sorted(idx, key=lambda i: self.weight[i], reverse=True):
+            if (self.text[i], self.kind[i]) in seen: continue
+            seen.add((self.text[i], self.kind[i])); out.append(i)
+            if len(out) == limit: break
+        return out
+
+    def query(self, prefix: str, limit: int) -> List[int]:
+        p = " ".join(tokenize(prefix))
+        if not p: return []
+        if p in self.top: return self.top[p][:limit]
+        lo = bisect.bisect_left(self.keys, p)
+        hi = bisect.bisect_left(self.keys, p + "\uffff", lo)
+        return self._best(range(lo, hi), limit)
+
 # ---- Utilities ----
 def load_artifacts():
-    # TF-IDF
-    STATE["tfidf"] = joblib.load(os.path.join(ART_DIR, "tfidf.joblib"))
-    STATE["vectorizer"] = joblib.load(os.path.join(ART_DIR, "tfidf_vectorizer.joblib"))
-    # BM25
-    with open(os.path.join(ART_DIR, "bm25.pkl"), "rb") as f:
-        obj = pickle.load(f)
-        STATE["bm25"] = obj["bm25"]
-        # meta will be overridden below by meta.json (they should match)
+    if SERVING_MODE == "lite":
+        STATE["tfidf"] = sparse.load_npz(os.path.join(ART_DIR, "tfidf.npz")).tocsr()
+        STATE["vectorizer"] = LiteVectorizer.load(ART_DIR)
+        STATE["bm25"] = LiteBM25.load(ART_DIR)
+    else:
+        import joblib  # deferred: unpickling the vectorizer pulls in sklearn
+        # TF-IDF
+        STATE["tfidf"] = joblib.load(os.path.join(ART_DIR, "tfidf.joblib"))
+        STATE["vectorizer"] = joblib.load(os.path.join(ART_DIR, "tfidf_vectorizer.joblib"))
+        # BM25
+        with open(os.path.join(ART_DIR, "bm25.pkl"), "rb") as f:
+            obj = pickle.load(f)
+            STATE["bm25"] = obj["bm25"]
+            # meta will be overridden below by meta.json (they should match)
     # META + CHUNKS
     STATE["meta"] = json.load(open(os.path.join(ART_DIR, "meta.json"), "r", encoding="utf-8"))
     # Rehydrate chunk texts for streaming/explain
@@ -54,7 +168,47 @@ def load_artifacts():
     # Protocol cards (optional; safe if missing)
     prot_path = os.path.join(ART_DIR, "protocol_cards.json")
     STATE["protocols"] = json.load(open(prot_path,"r",encoding="utf-8")) if os.path.exists(prot_path) else []
+    # Typeahead index (optional; built by build_indices)
+    sugg_path = os.path.join(ART_DIR, "suggest.json")
+    STATE["suggest"] = SuggestIndex(json.load(open(sugg_path,"r",encoding="utf-8"))) if os.path.exists(sugg_path) else None
+    load_evidence()
+    STATE["version"] = artifact_version()
+    STATE["recs_version"] = recs_version()
+    STATE["recs"] = {}
+    STATE["protocol_vecs"] = {p["slug"]: STATE["vectorizer"].transform([protocol_text(p)]) for p in STATE["protocols"]}
+    STATE["users"] = OrderedDict()
     print(f"[ART] Loaded: {len(STATE['meta'])} chunks; protocols={len(STATE['protocols'])}")
+    if not load_recommendations() and WARM_RECS: warm_recommendations()
+
+def artifact_version() -> str:
+    """Content hash of what user vectors are expressed in: vocabulary, IDF weights and
+    protocol cards. Rebuilding identical artifacts (or a fresh checkout) keeps the version."""
+    vz = STATE["vectorizer"]
+    h = hashlib.sha256()
+    h.update("\n".join(t for t, _ in sorted(vz.vocabulary_.items(), key=lambda kv: kv[1])).encode("utf-8"))
+    h.update(np.asarray(vz.idf_, dtype=np.float64).tobytes())
+    h.update(json.dumps(STATE["protocols"], sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def load_evidence():
+    """Resolve the precomputed card -> chunk table to row indices (optional artifact)."""
+    ev_path = os.path.join(ART_DIR, "protocol_evidence.json")
+    table = json.load(open(ev_path,"r",encoding="utf-8"))["evidence"] if os.path.exists(ev_path) else {}
+    row_of = {m["chunk_id"]: j for j, m in enumerate(STATE["meta"])}
+    coords = {(m["episode_id"], m["chunk_index"]) for m in STATE["meta"]}
+    STATE["evidence"] = {slug: [(row_of[e["chunk_id"]], e["score"]) for e in items if e["chunk_id"] in row_of]
+                         for slug, items in table.items()}
+    sources = {}
+    for p in STATE["protocols"]:
+        src, ev = p.get("source"), STATE["evidence"].get(p["slug"])
+        if src and (src.get("episode_id"), src.get("chunk_index")) in coords:
+            sources[p["slug"]] = src  # curated source that exists in this corpus
+        elif ev:
+            m = STATE["meta"][ev[0][0]]
+            sources[p["slug"]] = {"episode_id": m["episode_id"], "chunk_index": m["chunk_index"]}
+        else:
+            sources[p["slug"]] = src
+    STATE["protocol_sources"] = sources
 
 def ensure_loaded():
     if STATE["meta"] is None: load_artifacts()
@@ -75,9 +229,29 @@ def db():
         user_id TEXT, event TEXT, protocol_slug TEXT, variant TEXT,
         score REAL, ts TEXT
     )""")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_events_user_ts ON events(user_id, ts)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_events_slug_ts ON events(protocol_slug, ts)")
+    # Daily rollups, folded in from events by rollup_events()
+    con.execute("""CREATE TABLE IF NOT EXISTS event_daily (
+        day TEXT, protocol_slug TEXT, variant TEXT, event TEXT, n INTEGER, n_scored INTEGER, score_sum REAL,
+        PRIMARY KEY (day, protocol_slug, variant, event)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS user_daily (
+        user_id TEXT, day TEXT, event TEXT, n INTEGER,
+        PRIMARY KEY (user_id, day, event)
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS user_streak (
+        user_id TEXT PRIMARY KEY, current INTEGER, longest INTEGER, last_day TEXT, completed INTEGER
+    )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY, value INTEGER
+    )""")
     con.execute("""CREATE TABLE IF NOT EXISTS user_profile (
         user_id TEXT PRIMARY KEY, goals TEXT, tags TEXT
     )""")
+    con.execute("""CREATE TABLE IF NOT EXISTS user_vector (
+        user_id TEXT PRIMARY KEY, version TEXT, n_events INTEGER, last_id INTEGER, idx BLOB, val BLOB
+    )""")
     con.execute("""CREATE TABLE IF NOT EXISTS bandit (
         user_id TEXT, protocol_slug TEXT, success INTEGER, failure INTEGER,
         PRIMARY KEY (user_id, protocol_slug)
@@ -100,6 +274,73 @@ def bandit_update(user_id: str, slug: str, reward: int):
         cur.execute("UPDATE bandit SET success=?, failure=? WHERE user_id=? AND protocol_slug=?", (s,f,user_id,slug))
     con.commit(); con.close()
 
+def _event_day(ts: Optional[str]) -> str:
+    try: return datetime.date.fromisoformat((ts or "")[:10]).isoformat()
+    except ValueError: return time.strftime("%Y-%m-%d")
+
+def rollup_events(con) -> int:
+    """Fold events past the watermark into the daily rollups and streaks. Returns rows folded."""
+    cur = con.cursor()
+    cur.execute("BEGIN IMMEDIATE")  # serialize folders so no row is counted twice
+    cur.execute("SELECT value FROM rollup_state WHERE name='events'")
+    row = cur.fetchone(); mark = row[0] if row else 0
+    cur.execute("SELECT id,user_id,event,protocol_slug,variant,score,ts FROM events WHERE id>? ORDER BY id", (mark,))
+    rows = cur.fetchall()
+    for eid, user_id, event, slug, variant, score, ts in rows:
+        day = _event_day(ts)
+        # Unscored events count towards n but not towards the average score
+        cur.execute("""INSERT INTO event_daily VALUES (?,?,?,?,1,?,?)
+            ON CONFLICT(day,protocol_slug,variant,event) DO UPDATE SET n=n+1,
+                n_scored=n_scored+excluded.n_scored, score_sum=score_sum+excluded.score_sum""",
+                    (day, slug or "", variant or "default", event, int(score is not None), score or 0.0))
+        cur.execute("""INSERT INTO user_daily VALUES (?,?,?,1)
+            ON CONFLICT(user_id,day,event) DO UPDATE SET n=n+1""", (user_id, day, event))
+        if event == "completed": _bump_streak(cur, user_id, day)
+        mark = eid
+    cur.execute("INSERT OR REPLACE INTO rollup_state VALUES ('events', ?)", (mark,))
+    con.commit()
+    return len(rows)
+
+def _bump_streak(cur, user_id: str, day: str):
+    cur.execute("SELECT current,longest,last_day,completed FROM user_streak WHERE user_id=?", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        cur.execute("INSERT INTO user_streak VALUES (?,1,1,?,1)", (user_id, day)); return
+    current, longest, last_day, completed = row
+    gap = (datetime.date.fromisoformat(day) - datetime.date.fromisoformat(last_day)).days
+    if gap < 0:
+        # A late (offline-synced) completion can join or bridge earlier runs: recount from the rollup
+        current, longest = _streak_runs(cur, user_id)
+    elif gap == 1: current += 1
+    elif gap > 1: current = 1
+    # gap == 0: another completion on the same day; the streak is unchanged
+    if gap > 0: last_day = day
+    cur.execute("UPDATE user_streak SET current=?, longest=?, last_day=?, completed=? WHERE user_id=?",
+                (current, max(longest, current), last_day, completed + 1, user_id))
+
+def _streak_runs(cur, user_id: str) -> Tuple[int, int]:
+    """(run ending on the latest completion day, longest run) over the user's completed days."""
+    cur.execute("SELECT day FROM user_daily WHERE user_id=? AND event='completed' ORDER BY day", (user_id,))
+    current = longest = 0; prev = None
+    for (day,) in cur.fetchall():
+        d = datetime.date.fromisoformat(day)
+        current = current + 1 if prev is not None and (d - prev).days == 1 else 1
+        longest = max(longest, current); prev = d
+    return current, longest
+
+def compact_events(retain_days: int = RETAIN_DAYS) -> Dict[str, int]:
+    """Fold everything into the rollups, then drop raw events older than retain_days."""
+    if retain_days < 1:
+        raise ValueError("retain_days must be at least 1")  # 0 or less would drop today's events
+    con = db()
+    folded = rollup_events(con)
+    cutoff = (datetime.date.today() - datetime.timedelta(days=retain_days)).isoformat()
+    cur = con.cursor()
+    cur.execute("DELETE FROM events WHERE ts < ? AND id <= (SELECT value FROM rollup_state WHERE name='events')", (cutoff,))
+    deleted = cur.rowcount
+    con.commit(); con.close()
+    return {"folded": folded, "deleted": deleted}
+
 def bandit_scores(user_id: str) -> Dict[str, Tuple[int,int]]:
     con = db(); cur = con.cursor()
     cur.execute("SELECT protocol_slug, success, failure FROM bandit WHERE user_id=?", (user_id,))
@@ -123,6 +364,15 @@ class SearchResponse(BaseModel):
     mode: str
     count: int
 
+class SuggestItem(BaseModel):
+    text: str
+    kind: str = Field(description="term|phrase|episode|protocol")
+    weight: float
+
+class SuggestResponse(BaseModel):
+    prefix: str
+    items: List[SuggestItem]
+
 class RecommendResponse(BaseModel):
     items: List[SearchItem]
     reasons: List[str] = []
@@ -140,6 +390,11 @@ class TodayResponse(BaseModel):
     reason: str
     copy: TodayCopy
     source: Optional[Dict[str, Any]] = None
+    evidence: List[SearchItem] = []
+
+class EvidenceResponse(BaseModel):
+    protocol_slug: str
+    items: List[SearchItem]
 
 class EventIn(BaseModel):
     user_id: str
@@ -154,6 +409,25 @@ class UserProfile(BaseModel):
     goals: List[str] = []
     tags: List[str] = []
 
+class DayStats(BaseModel):
+    day: str
+    counts: Dict[str, int] = {}
+
+class UserStats(BaseModel):
+    user_id: str
+    current_streak: int = 0
+    longest_streak: int = 0
+    last_day: Optional[str] = None
+    completed: int = 0
+    days: List[DayStats] = []
+
+class ProtocolStats(BaseModel):
+    protocol_slug: str
+    variant: str
+    event: str
+    count: int
+    avg_score: Optional[float] = None
+
 # ---- App lifecycle ----
 @app.on_event("startup")
 def _startup():
@@ -164,7 +438,8 @@ def _startup():
 @app.get("/v1/health")
 def health():
     ensure_loaded()
-    return {"status":"ok", "chunks": len(STATE["meta"]), "protocols": len(STATE["protocols"])}
+    return {"status":"ok", "chunks": len(STATE["meta"]), "protocols": len(STATE["protocols"]),
+            "version": STATE["version"], "recs_cached": len(STATE["recs"])}
 
 @app.post("/v1/admin/refresh")
 def refresh(x_api_key: Optional[str] = Header(default=None)):
@@ -172,35 +447,49 @@ def refresh(x_api_key: Optional[str] = Header(default=None)):
     load_artifacts()
     return {"status": "reloaded", "chunks": len(STATE["meta"])}
 
+@app.post("/v1/admin/compact")
+def compact(retain_days: int = Query(RETAIN_DAYS, ge=1), x_api_key: Optional[str] = Header(default=None)):
+    require_api_key(x_api_key)
+    return {"status": "compacted", "retain_days": retain_days, **compact_events(retain_days)}
+
 # ---- Search ----
+def search_item(j: int, score: float) -> SearchItem:
+    m = STATE["meta"][j]
+    txt = STATE["chunks"][j]
+    snippet = txt[:240].replace("\n"," ") + ("…" if len(txt)>240 else "")
+    return SearchItem(
+        chunk_id=m["chunk_id"], episode_id=m["episode_id"], episode_title=m["episode_title"],
+        chunk_index=m["chunk_index"], title_sent=m["title_sent"], why_sent=m["why_sent"],
+        snippet=snippet, score=score
+    )
+
 @app.get("/v1/search", response_model=SearchResponse)
 def search(q: str, mode: str = Query("bm25", enum=["bm25", "tfidf"]),
            limit: int = 10, offset: int = 0):
     ensure_loaded()
-    meta = STATE["meta"]
-    texts = STATE["chunks"]
-
     if mode == "bm25":
         bm25 = STATE["bm25"]
         toks = tokenize(q)
         scores = bm25.get_scores(toks)
     else:
         vec = STATE["vectorizer"].transform([q])
-        scores = cosine_similarity(vec, STATE["tfidf"]).ravel()
+        scores = cosine_scores(vec, STATE["tfidf"])
 
     idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
     idx = idx[offset: offset+limit]
-    items = []
-    for i in idx:
-        m = meta[i]
-        snippet = texts[i][:240].replace("\n"," ") + ("…" if len(texts[i])>240 else "")
-        items.append(SearchItem(
-            chunk_id=m["chunk_id"], episode_id=m["episode_id"], episode_title=m["episode_title"],
-            chunk_index=m["chunk_index"], title_sent=m["title_sent"], why_sent=m["why_sent"],
-            snippet=snippet, score=float(scores[i])
-        ))
+    items = [search_item(i, float(scores[i])) for i in idx]
     return {"items": items, "mode": mode, "count": len(scores)}
 
+# ---- Suggest (typeahead) ----
+@app.get("/v1/suggest", response_model=SuggestResponse)
+def suggest(prefix: str, limit: int = Query(8, ge=1, le=SUGGEST_MAX)):
+    ensure_loaded()
+    idx = STATE["suggest"]
+    if idx is None:
+        raise HTTPException(503, "Suggest index not built yet")
+    items = [SuggestItem(text=idx.text[i], kind=idx.kind[i], weight=idx.weight[i]) for i in idx.query(prefix, limit)]
+    return {"prefix": prefix, "items": items}
+
 # ---- Recommend (Discover) ----
 def user_profile_vector(tags: List[str]) -> Any:
     if not tags: tags = ["sleep","focus"]
@@ -208,35 +497,227 @@ def user_profile_vector(tags: List[str]) -> Any:
     return STATE["vectorizer"].transform([q])
 
 def mmr(query_vec, doc_mat, topk=10, lam=0.6):
-    sims = cosine_similarity(query_vec, doc_mat).ravel()
+    # Rows of the TF-IDF matrix are L2-normalised, so cosine similarity is a dot
+    # product; keep a running max-similarity to the selected set instead of
+    # recomputing it pairwise on every step.
+    sims = cosine_scores(query_vec, doc_mat)
+    n = doc_mat.shape[0]
     selected = []
-    candidates = list(range(doc_mat.shape[0]))
-    while len(selected) < topk and candidates:
+    if n == 0: return selected, sims
+    available = np.ones(n, dtype=bool)
+    diversity = np.full(n, -np.inf)
+    while len(selected) < min(topk, n):
         if not selected:
-            best = max(candidates, key=lambda j: sims[j])
-            selected.append(best); candidates.remove(best); continue
-        def diversity(j): return max(cosine_similarity(doc_mat[j], doc_mat[s]) for s in selected)
-        scored = [(lam*sims[j] - (1-lam)*diversity(j), j) for j in candidates]
-        scored.sort(reverse=True)
-        selected.append(scored[0][1]); candidates.remove(scored[0][1])
+            best = int(np.argmax(sims))
+        else:
+            scored = np.where(available, lam*sims - (1-lam)*diversity, -np.inf)
+            best = n - 1 - int(np.argmax(scored[::-1]))  # ties -> highest index
+        selected.append(best); available[best] = False
+        np.maximum(diversity, doc_mat @ doc_mat[best].toarray().ravel(), out=diversity)
     return selected, sims
 
+# Onboarding focus tracks -> API tags (mirrors mapFocusTracksToTags in src/services/api.ts)
+FOCUS_TRACK_TAGS = {
+    "sleep": ["sleep", "circadian", "recovery"],
+    "focus": ["focus", "attention", "productivity", "cognitive"],
+    "energy": ["energy", "metabolic", "performance"],
+}
+RECS_TOPK = 50        # largest topk recommend() accepts; MMR is greedy so shorter lists are prefixes
+RECS_MAX_ENTRIES = 4096
+
+def canonical_tags(tags: List[str]) -> Tuple[str, ...]:
+    return tuple(sorted({t.strip().lower() for t in tags if t and t.strip()}))
+
+def known_tag_sets() -> List[Tuple[str, ...]]:
+    from itertools import combinations
+    vocab = {t for tags in FOCUS_TRACK_TAGS.values() for t in tags}
+    vocab |= {t for p in STATE["protocols"] or [] for t in p.get("tags", [])}
+    sets = {()} | {canonical_tags([t]) for t in vocab}
+    sets |= {canonical_tags(p.get("tags", [])) for p in STATE["protocols"] or []}
+    tracks = list(FOCUS_TRACK_TAGS)
+    for r in range(1, len(tracks)+1):
+        for combo in combinations(tracks, r):
+            sets.add(canonical_tags(combo))
+            sets.add(canonical_tags([t for tr in combo for t in FOCUS_TRACK_TAGS[tr]]))
+    return sorted(sets)
+
+def recommend_indices(tags: List[str]) -> Tuple[List[int], List[float]]:
+    """Top-RECS_TOPK MMR selection for a tag set, served from the materialized table."""
+    key = canonical_tags(tags)
+    hit = STATE["recs"].get(key)
+    if hit is not None: return hit
+    sel, sims = mmr(user_profile_vector(list(key)), STATE["tfidf"], topk=RECS_TOPK)
+    entry = (sel, [float(sims[j]) for j in sel])
+    if len(STATE["recs"]) < RECS_MAX_ENTRIES: STATE["recs"][key] = entry
+    return entry
+
+def warm_recommendations():
+    t0 = time.time()
+    for key in known_tag_sets(): recommend_indices(list(key))
+    print(f"[REC] Warmed {len(STATE['recs'])} tag sets in {time.time()-t0:.1f}s (version={STATE['recs_version']})")
+
+def recs_version() -> str:
+    """Everything a materialized MMR list depends on: vocabulary/IDF/cards, the TF-IDF rows and RECS_TOPK."""
+    X = STATE["tfidf"]
+    h = hashlib.sha256(f"{STATE['version']}:{RECS_TOPK}:{X.shape}".encode("utf-8"))
+    for a in (X.indptr.astype(np.int64), X.indices.astype(np.int64), X.data): h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()[:16]
+
+def save_recommendations():
+    """Write the warmed table to artifacts/recs.json (scripts/build_recs.py) so servers skip warming."""
+    table = [{"tags": list(key), "rows": sel, "scores": [round(x, 6) for x in scores]}
+             for key, (sel, scores) in sorted(STATE["recs"].items())]
+    json.dump({"version": STATE["recs_version"], "table": table},
+              open(os.path.join(ART_DIR, "recs.json"), "w", encoding="utf-8"))
+
+def load_recommendations() -> bool:
+    """Load artifacts/recs.json if it was built from exactly these artifacts."""
+    path = os.path.join(ART_DIR, "recs.json")
+    if not os.path.exists(path): return False
+    data = json.load(open(path, "r", encoding="utf-8"))
+    if data.get("version") != STATE["recs_version"]:
+        print(f"[REC] Ignoring stale recs.json (built for {data.get('version')}, artifacts are {STATE['recs_version']})")
+        return False
+    STATE["recs"] = {tuple(e["tags"]): (e["rows"], e["scores"]) for e in data["table"]}
+    print(f"[REC] Loaded {len(STATE['recs'])} tag sets from recs.json")
+    return True
+
+# ---- Personalization (incremental per-user preference vectors) ----
+# Each user carries a sparse TF-IDF-space vector that is nudged towards (or away
+# from) a protocol card's text whenever an event arrives. Vectors are persisted
+# in SQLite, keyed by artifact version, and cached in memory; last_id is the id
+# of the newest event folded in, so replaying from it never counts one twice.
+EVENT_WEIGHTS = {"completed": 1.0, "like": 1.5, "skip": -0.5}
+PREF_DECAY = 0.9       # weight kept by the previous vector on each update
+PREF_TERMS = 256       # non-zero terms kept per user vector
+PREF_ALPHA = 1.0       # weight of the preference vector relative to the tag query
+USER_CACHE_MAX = 10000
+USER_SAVE_RETRIES = 5  # compare-and-set attempts before giving up on a contended row
+USER_LOCKS = [threading.RLock() for _ in range(64)]  # striped per-user locks within a worker
+
+def protocol_text(card: Dict[str, Any]) -> str:
+    return " ".join([card.get("title",""), card.get("action",""), card.get("why",""), " ".join(card.get("tags",[]))])
+
+def _prune(vec):
+    vec = vec.tocsr(); vec.data[vec.data < 0] = 0; vec.eliminate_zeros()
+    if vec.nnz > PREF_TERMS:
+        keep = np.argpartition(vec.data, -PREF_TERMS)[-PREF_TERMS:]
+        vec = sparse.csr_matrix((vec.data[keep], (np.zeros(len(keep), dtype=np.int32), vec.indices[keep])), shape=vec.shape)
+    return vec
+
+def _apply_event(vec, event: str, slug: Optional[str]):
+    card = STATE["protocol_vecs"].get(slug)
+    if card is None or event not in EVENT_WEIGHTS: return vec, False
+    base = vec * PREF_DECAY if vec is not None else sparse.csr_matrix(card.shape)
+    return _prune(base + EVENT_WEIGHTS[event] * card), True
+
+def _user_lock(user_id: str):
+    return USER_LOCKS[zlib.crc32(user_id.encode("utf-8")) % len(USER_LOCKS)]
+
+def _cache_user(user_id: str, prefs: Dict[str, Any]):
+    users = STATE["users"]
+    users[user_id] = prefs; users.move_to_end(user_id)
+    if len(users) > USER_CACHE_MAX: users.popitem(last=False)
+
+def _save_user_vector(user_id: str, prefs: Dict[str, Any]) -> bool:
+    """Compare-and-set write: succeeds only if the stored row is still the one prefs was read from."""
+    vec = prefs["vec"]; vec.sort_indices()
+    row = (STATE["version"], prefs["n_events"], prefs["last_id"],
+           vec.indices.astype(np.int32).tobytes(), vec.data.astype(np.float32).tobytes())
+    con = db(); cur = con.cursor()
+    if prefs["stored"] is None:
+        cur.execute("INSERT OR IGNORE INTO user_vector(user_id,version,n_events,last_id,idx,val) VALUES(?,?,?,?,?,?)",
+                    (user_id, *row))
+    else:
+        cur.execute("""UPDATE user_vector SET version=?, n_events=?, last_id=?, idx=?, val=?
+            WHERE user_id=? AND version IS ? AND last_id IS ?""", (*row, user_id, *prefs["stored"]))
+    ok = cur.rowcount == 1
+    con.commit(); con.close()
+    if ok: prefs["stored"] = (STATE["version"], prefs["last_id"])
+    return ok
+
+def _fold_events(user_id: str, prefs: Dict[str, Any], upto_id: Optional[int] = None) -> bool:
+    """Apply the user's events past prefs["last_id"] (up to upto_id) to the vector. Returns True if any were new."""
+    con = db(); cur = con.cursor()
+    cur.execute("SELECT id, event, protocol_slug FROM events WHERE user_id=? AND id>? AND id<=? ORDER BY id",
+                (user_id, prefs["last_id"], upto_id if upto_id is not None else 2**63-1))
+    rows = cur.fetchall(); con.close()
+    for eid, event, slug in rows:
+        prefs["vec"], used = _apply_event(prefs["vec"], event, slug)
+        prefs["n_events"] += used
+        prefs["last_id"] = eid
+    return bool(rows)
+
+def _load_prefs(user_id: str) -> Tuple[Dict[str, Any], bool]:
+    """Stored vector plus any events past its watermark. False if another worker wrote the row meanwhile."""
+    con = db(); cur = con.cursor()
+    cur.execute("SELECT version, n_events, last_id, idx, val FROM user_vector WHERE user_id=?", (user_id,))
+    row = cur.fetchone(); con.close()
+    prefs = {"vec": None, "n_events": 0, "last_id": 0, "recs": {}, "stored": (row[0], row[2]) if row else None}
+    if row and row[0] == STATE["version"]:
+        idx = np.frombuffer(row[3], dtype=np.int32); val = np.frombuffer(row[4], dtype=np.float32)
+        prefs["vec"] = sparse.csr_matrix((val.astype(np.float64), idx, [0, len(idx)]), shape=(1, len(STATE["vectorizer"].vocabulary_)))
+        prefs["n_events"], prefs["last_id"] = row[1], row[2]
+    # A missing or stale row is replayed from the raw events (once per user after the
+    # vocabulary changes); otherwise only events no worker has folded in yet are applied.
+    if _fold_events(user_id, prefs) and prefs["vec"] is not None:
+        return prefs, _save_user_vector(user_id, prefs)
+    return prefs, True
+
+def user_prefs(user_id: str) -> Dict[str, Any]:
+    """Profile tags + preference vector for a user. Other workers write both, so the
+    cached copy is only reused while it still matches the stored row."""
+    with _user_lock(user_id):
+        con = db(); cur = con.cursor()
+        cur.execute("SELECT version, last_id FROM user_vector WHERE user_id=?", (user_id,))
+        head = cur.fetchone(); con.close()
+        prefs = STATE["users"].get(user_id)
+        if prefs is None or prefs["stored"] != (tuple(head) if head else None):
+            for _ in range(USER_SAVE_RETRIES):
+                prefs, ok = _load_prefs(user_id)
+                if ok: break
+            else:
+                return dict(prefs, tags=get_user(user_id).tags)  # still contended: serve it uncached
+        prefs["tags"] = get_user(user_id).tags
+        _cache_user(user_id, prefs)
+        return prefs
+
+def update_user_vector(user_id: str, event_id: int):
+    """Fold a freshly inserted event (and any earlier unseen ones) into the user's vector."""
+    with _user_lock(user_id):
+        for _ in range(USER_SAVE_RETRIES):
+            prefs = user_prefs(user_id)
+            if prefs["last_id"] >= event_id: return  # already applied when the vector was loaded
+            new = dict(prefs, recs={})
+            _fold_events(user_id, new, upto_id=event_id)
+            if new["vec"] is None or _save_user_vector(user_id, new):
+                _cache_user(user_id, new); return
+            # Another worker moved the row on; user_prefs re-reads it on the next pass
+        print(f"[PREF] Gave up updating {user_id} after {USER_SAVE_RETRIES} write conflicts")
+
+def personalized_indices(user_id: str, tags: List[str]) -> Tuple[List[int], List[float], Dict[str, Any]]:
+    prefs = user_prefs(user_id)
+    key = canonical_tags(tags or prefs["tags"])
+    if prefs["vec"] is None or prefs["vec"].nnz == 0:
+        return (*recommend_indices(list(key)), prefs)
+    hit = prefs["recs"].get(key)
+    if hit is None:
+        qv = l2_normalize(user_profile_vector(list(key))) + PREF_ALPHA * l2_normalize(prefs["vec"])
+        sel, sims = mmr(qv, STATE["tfidf"], topk=RECS_TOPK)
+        hit = prefs["recs"][key] = (sel, [float(sims[j]) for j in sel])
+    return (*hit, prefs)
+
 @app.get("/v1/recommend", response_model=RecommendResponse)
-def recommend(tags: List[str] = Query(default=[]), topk: int = 10):
+def recommend(tags: List[str] = Query(default=[]), topk: int = Query(10, ge=1, le=RECS_TOPK), user_id: Optional[str] = None):
     ensure_loaded()
-    qv = user_profile_vector(tags)
-    sel, sims = mmr(qv, STATE["tfidf"], topk=min(topk, 50))
-    items = []
-    for j in sel:
-        m = STATE["meta"][j]
-        txt = STATE["chunks"][j]
-        snippet = txt[:240].replace("\n"," ") + ("…" if len(txt)>240 else "")
-        items.append(SearchItem(
-            chunk_id=m["chunk_id"], episode_id=m["episode_id"], episode_title=m["episode_title"],
-            chunk_index=m["chunk_index"], title_sent=m["title_sent"], why_sent=m["why_sent"],
-            snippet=snippet, score=float(sims[j])
-        ))
+    if user_id:
+        sel, scores, prefs = personalized_indices(user_id, tags)
+        tags = tags or prefs["tags"]
+    else:
+        sel, scores = recommend_indices(tags)
+    items = [search_item(j, score) for j, score in zip(sel[:topk], scores)]
     reasons = [f"tags:{','.join(tags) or 'default'}", "model:tfidf+mmr"]
+    if user_id: reasons.append(f"profile:events={prefs['n_events']}")
     return {"items": items, "reasons": reasons}
 
 # ---- Explain (Why?) ----
@@ -263,8 +744,8 @@ def thompson_sample(user_id: str, protocols: List[Dict[str,Any]]) -> Dict[str,An
     best, best_draw = None, -1
     for p in protocols:
         slug = p["slug"]
-        s,f = stats.get(slug, (1,1))  # Beta(1,1) prior
-        draw = random.betavariate(s, f)
+        s,f = stats.get(slug, (0,0))  # stored counts are observations, not Beta parameters
+        draw = random.betavariate(s+1, f+1)  # Beta(1,1) prior
         if draw > best_draw:
             best, best_draw = p, draw
     return best
@@ -285,9 +766,19 @@ def next_card(user_id: str, goals: Optional[List[str]] = Query(default=None)):
         variant="default",
         reason="bandit:thompson",
         copy=copy,
-        source=card.get("source")  # e.g., {"episode_id":"...", "chunk_index": 3}
+        source=STATE["protocol_sources"].get(card["slug"], card.get("source")),  # {"episode_id":"...", "chunk_index": 3}
+        evidence=[search_item(j, score) for j, score in STATE["evidence"].get(card["slug"], [])]
     )
 
+# ---- Protocol evidence (precomputed at index time) ----
+@app.get("/v1/protocols/{slug}/evidence", response_model=EvidenceResponse)
+def protocol_evidence(slug: str, limit: int = Query(5, ge=1, le=50)):
+    ensure_loaded()
+    if not any(p["slug"] == slug for p in STATE["protocols"]):
+        raise HTTPException(404, "protocol not found")
+    items = [search_item(j, score) for j, score in STATE["evidence"].get(slug, [])[:limit]]
+    return {"protocol_slug": slug, "items": items}
+
 # ---- Events (learning loop) ----
 @app.post("/v1/events")
 def events(ev: EventIn, x_api_key: Optional[str] = Header(default=None)):
@@ -295,11 +786,17 @@ def events(ev: EventIn, x_api_key: Optional[str] = Header(default=None)):
     con = db(); cur = con.cursor()
     cur.execute("INSERT INTO events (user_id,event,protocol_slug,variant,score,ts) VALUES (?,?,?,?,?,?)",
                 (ev.user_id, ev.event, ev.protocol_slug, ev.variant, ev.score, ev.ts or time.strftime("%Y-%m-%dT%H:%M:%SZ")))
-    con.commit(); con.close()
+    event_id = cur.lastrowid
+    con.commit()
+    rollup_events(con)
+    con.close()
     # Update bandit on completed/skip (reward = 1 if completed/like else 0)
     if ev.protocol_slug and ev.event in ("completed", "like", "skip"):
         reward = 1 if ev.event in ("completed","like") else 0
         bandit_update(ev.user_id, ev.protocol_slug, reward)
+    if ev.protocol_slug and ev.event in EVENT_WEIGHTS:
+        ensure_loaded()
+        update_user_vector(ev.user_id, event_id)
     return {"status":"ok"}
 
 # ---- User profile ----
@@ -323,4 +820,37 @@ def patch_user(user_id: str, payload: UserProfile, x_api_key: Optional[str] = He
     cur.execute("INSERT INTO user_profile(user_id,goals,tags) VALUES(?,?,?) ON CONFLICT(user_id) DO UPDATE SET goals=?, tags=?",
                 (user_id, goals, tags, goals, tags))
     con.commit(); con.close()
-    return payload
+    return payload  # cached prefs re-read their tags from user_profile on each access
+
+# ---- Stats (served from rollups) ----
+@app.get("/v1/users/{user_id}/stats", response_model=UserStats)
+def user_stats(user_id: str, days: int = Query(7, ge=1, le=366)):
+    con = db(); cur = con.cursor()
+    cur.execute("SELECT current,longest,last_day,completed FROM user_streak WHERE user_id=?", (user_id,))
+    row = cur.fetchone()
+    start = (datetime.date.today() - datetime.timedelta(days=days-1)).isoformat()
+    cur.execute("SELECT day,event,n FROM user_daily WHERE user_id=? AND day>=? ORDER BY day", (user_id, start))
+    by_day: Dict[str, Dict[str, int]] = {}
+    for day, event, n in cur.fetchall():
+        by_day.setdefault(day, {})[event] = n
+    con.close()
+    out = UserStats(user_id=user_id, days=[DayStats(day=d, counts=c) for d, c in by_day.items()])
+    if row:
+        current, longest, last_day, completed = row
+        # A streak is still alive if the last completion was today or yesterday
+        alive = (datetime.date.today() - datetime.date.fromisoformat(last_day)).days <= 1
+        out.current_streak, out.longest_streak = (current if alive else 0), longest
+        out.last_day, out.completed = last_day, completed
+    return out
+
+@app.get("/v1/stats/protocols", response_model=List[ProtocolStats])
+def protocol_stats(days: int = Query(30, ge=1, le=366)):
+    con = db(); cur = con.cursor()
+    start = (datetime.date.today() - datetime.timedelta(days=days-1)).isoformat()
+    cur.execute("""SELECT protocol_slug, variant, event, SUM(n), SUM(n_scored), SUM(score_sum) FROM event_daily
+        WHERE day>=? GROUP BY protocol_slug, variant, event ORDER BY protocol_slug, variant, event""", (start,))
+    out = [ProtocolStats(protocol_slug=slug, variant=variant, event=event, count=n,
+                         avg_score=(ssum/n_scored if n_scored else None))
+           for slug, variant, event, n, n_scored, ssum in cur.fetchall()]
+    con.close()
+    return out
@@ -0,0 +1,52 @@
+# scripts/bench_startup.py
+# Cold-start benchmark: SERVING_MODE=full vs SERVING_MODE=lite, each in a fresh interpreter
+# with the server's default settings. load includes the recommend table (artifacts/recs.json,
+# or warming if it is missing/stale); warm is what warming alone costs, reported separately.
+import os, json, subprocess, sys
+
+RUNS = int(os.environ.get("BENCH_RUNS", "3"))
+QUERIES = ["sleep and recovery", "morning sunlight circadian rhythm", "dopamine motivation reward",
+           "exercise strength training", "nutrition diet health"]
+
+CHILD = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+from api import server
+t1 = time.perf_counter()
+server.load_artifacts()
+t2 = time.perf_counter()
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+top = {m: [[it.chunk_id for it in server.search(q, mode=m, limit=10)["items"]] for q in json.loads(sys.argv[1])]
+       for m in ("bm25", "tfidf")}
+recs_file = server.load_recommendations()
+server.STATE["recs"] = {}
+t3 = time.perf_counter()
+server.warm_recommendations()
+t4 = time.perf_counter()
+print(json.dumps({"import_s": t1-t0, "load_s": t2-t1, "warm_s": t4-t3, "recs_file": recs_file,
+                  "sklearn": "sklearn" in sys.modules, "maxrss_mb": maxrss, "top": top}))
+"""
+
+def run(mode):
+    env = dict(os.environ, SERVING_MODE=mode)
+    out = subprocess.check_output([sys.executable, "-c", CHILD, json.dumps(QUERIES)], env=env, cwd=os.getcwd())
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+
+def main():
+    results = {}
+    for mode in ("full", "lite"):
+        runs = [run(mode) for _ in range(RUNS)]
+        best = min(runs, key=lambda r: r["import_s"] + r["load_s"])
+        results[mode] = best
+        print(f"{mode:5s} import={best['import_s']*1000:7.1f}ms load={best['load_s']*1000:7.1f}ms "
+              f"total={(best['import_s']+best['load_s'])*1000:7.1f}ms maxrss={best['maxrss_mb']:.0f}MB "
+              f"sklearn_loaded={best['sklearn']} recs={'recs.json' if best['recs_file'] else 'warmed'} "
+              f"(warming alone: {best['warm_s']*1000:.0f}ms)")
+    for m in ("bm25", "tfidf"):
+        overlap = [len(set(a) & set(b)) / max(len(a), 1) for a, b in zip(results["full"]["top"][m], results["lite"]["top"][m])]
+        print(f"{m:5s} top-10 overlap full vs lite: {sum(overlap)/len(overlap):.3f}")
+    full, lite = (results[k]["import_s"] + results[k]["load_s"] for k in ("full", "lite"))
+    print(f"speedup: {full/lite:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# scripts/build_evidence.py
+# Protocol-card evidence: each card in artifacts/protocol_cards.json resolved once,
+# at index time, to its top supporting chunks. Written by build_indices.py /
+# build_indices_stream.py; served by /v1/next and /v1/protocols/{slug}/evidence.
+import os, json
+
+EVIDENCE_K = 5      # chunks stored per card
+CANDIDATES = 50     # per-engine candidates fused into the final list
+RRF_K      = 60     # reciprocal-rank-fusion damping
+
+def load_cards(art_dir):
+    path = os.path.join(art_dir, "protocol_cards.json")
+    return json.load(open(path, "r", encoding="utf-8")) if os.path.exists(path) else []
+
+def card_query(card):
+    # Same text the server embeds for a card (api/server.py protocol_text)
+    return " ".join([card.get("title",""), card.get("action",""), card.get("why",""), " ".join(card.get("tags",[]))])
+
+def top_candidates(scores, n=CANDIDATES):
+    """Indices of the n best positive scores, best first."""
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:n]
+    return [i for i in order if scores[i] > 0]
+
+def fuse(rankings, k=EVIDENCE_K):
+    """Reciprocal rank fusion of best-first id lists -> [(id, score)]."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+def write_evidence(art_dir, evidence):
+    """evidence: {slug: [(chunk_id, score), ...]}"""
+    out = {slug: [{"chunk_id": cid, "score": round(score, 6)} for cid, score in items]
+           for slug, items in evidence.items()}
+    json.dump({"k": EVIDENCE_K, "evidence": out},
+              open(os.path.join(art_dir, "protocol_evidence.json"), "w", encoding="utf-8"), ensure_ascii=False)
+    print(f"✅ Protocol evidence: {len(out)} cards x top-{EVIDENCE_K} chunks")
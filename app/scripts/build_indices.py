@@ -1,11 +1,100 @@
 # scripts/build_indices.py
 import os, json, re, pickle, joblib
+import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
 from rank_bm25 import BM25Okapi
+from build_suggest import write_suggest
+from build_evidence import load_cards, card_query, top_candidates, fuse, write_evidence
 
 PROC_DIR = "data/processed"
 ART_DIR  = "artifacts"
 
+# Compact TF-IDF artifact: float32 values + int32 indices, pruned and renormalised rows
+TFIDF_COMPACT    = os.environ.get("TFIDF_COMPACT", "0") == "1"
+TFIDF_MIN_WEIGHT = float(os.environ.get("TFIDF_MIN_WEIGHT", "0.057")) # drop weights below this
+TFIDF_TOPN       = int(os.environ.get("TFIDF_TOPN", "0"))               # keep top-N terms per chunk (0 = all)
+# Targets tfidf_report.json is checked against; a miss warns, or fails the build with TFIDF_STRICT=1
+TFIDF_TARGET_SAVED   = float(os.environ.get("TFIDF_TARGET_SAVED", "50"))      # % of matrix bytes saved
+TFIDF_TARGET_OVERLAP = float(os.environ.get("TFIDF_TARGET_OVERLAP", "0.93"))  # overlap@10 with the full matrix
+TFIDF_STRICT         = os.environ.get("TFIDF_STRICT", "0") == "1"
+
+def csr_nbytes(X):
+    return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+def compact_tfidf(X, min_weight=TFIDF_MIN_WEIGHT, top_n=TFIDF_TOPN):
+    X = X.tocsr().astype(np.float32)
+    if min_weight > 0:
+        X.data[X.data < min_weight] = 0
+        X.eliminate_zeros()
+    if top_n > 0:
+        keep = np.zeros(X.nnz, dtype=bool)
+        for i in range(X.shape[0]):
+            a, b = X.indptr[i], X.indptr[i+1]
+            if b - a <= top_n: keep[a:b] = True
+            else: keep[a + np.argpartition(X.data[a:b], -top_n)[-top_n:]] = True
+        X.data[~keep] = 0
+        X.eliminate_zeros()
+    X = normalize(X)
+    return sparse.csr_matrix((X.data, X.indices.astype(np.int32), X.indptr.astype(np.int32)), shape=X.shape)
+
+def compact_report(vec, X_full, X_small, queries, k=10):
+    Q = vec.transform(queries)
+    full, small = (Q @ X_full.T).toarray(), (Q @ X_small.T).toarray()
+    overlap = [len(set(np.argsort(-f)[:k]) & set(np.argsort(-s)[:k])) / k for f, s in zip(full, small)]
+    return {
+        "bytes_full": int(csr_nbytes(X_full)), "bytes_compact": int(csr_nbytes(X_small)),
+        "saved_pct": round(100 * (1 - csr_nbytes(X_small) / csr_nbytes(X_full)), 1),
+        "nnz_full": int(X_full.nnz), "nnz_compact": int(X_small.nnz),
+        f"overlap_at_{k}": round(float(np.mean(overlap)), 4), "queries": len(queries),
+        "min_weight": TFIDF_MIN_WEIGHT, "top_n": TFIDF_TOPN,
+        "target_saved_pct": TFIDF_TARGET_SAVED, f"target_overlap_at_{k}": TFIDF_TARGET_OVERLAP,
+    }
+
+def check_report(report):
+    misses = []
+    if report["saved_pct"] < TFIDF_TARGET_SAVED:
+        misses.append(f"saved {report['saved_pct']}% < {TFIDF_TARGET_SAVED}%")
+    if report["overlap_at_10"] < TFIDF_TARGET_OVERLAP:
+        misses.append(f"overlap@10 {report['overlap_at_10']} < {TFIDF_TARGET_OVERLAP}")
+    if not misses: return
+    msg = "TF-IDF compaction missed its targets: " + "; ".join(misses) + " (tune TFIDF_MIN_WEIGHT / TFIDF_TOPN)"
+    if TFIDF_STRICT: raise SystemExit(f"❌ {msg}")
+    print(f"⚠️  {msg}")
+
+# Vectorizer settings LiteVectorizer (api/server.py) hard-codes rather than reads from tfidf_lite.json
+LITE_FIXED_PARAMS = {"analyzer": "word", "strip_accents": None, "stop_words": None, "preprocessor": None,
+                     "tokenizer": None, "binary": False, "use_idf": True}
+
+def export_lite_tfidf(vec, X):
+    """Plain TF-IDF artifacts for the sklearn-free serving mode (SERVING_MODE=lite)."""
+    params = vec.get_params()
+    settings = {k: params[k] for k in ("lowercase", "token_pattern", "ngram_range", "norm", "sublinear_tf")}
+    unsupported = {k: params[k] for k, v in LITE_FIXED_PARAMS.items() if params[k] != v}
+    if np.dtype(params["dtype"]) != np.float64: unsupported["dtype"] = params["dtype"]
+    if unsupported:
+        raise ValueError(f"lite export does not support vectorizer settings: {unsupported}")
+    vocab = [None] * len(vec.vocabulary_)
+    for term, j in vec.vocabulary_.items(): vocab[j] = term
+    json.dump({"settings": settings, "vocab": vocab},
+              open(os.path.join(ART_DIR, "tfidf_lite.json"), "w", encoding="utf-8"), ensure_ascii=False)
+    np.save(os.path.join(ART_DIR, "tfidf_idf.npy"), vec.idf_)
+    sparse.save_npz(os.path.join(ART_DIR, "tfidf.npz"), X.tocsr(), compressed=False)
+
+def export_lite_bm25(bm):
+    """BM25Okapi as a docs x terms matrix of per-posting weights, so scoring a query is a column sum."""
+    vocab = sorted(bm.idf)
+    col = {t: j for j, t in enumerate(vocab)}
+    rows, cols, vals = [], [], []
+    for d, freqs in enumerate(bm.doc_freqs):
+        norm = bm.k1 * (1 - bm.b + bm.b * bm.doc_len[d] / bm.avgdl)
+        for t, tf in freqs.items():
+            rows.append(d); cols.append(col[t]); vals.append(bm.idf[t] * tf * (bm.k1 + 1) / (tf + norm))
+    W = sparse.csc_matrix((np.asarray(vals, dtype=np.float32), (rows, cols)), shape=(len(bm.doc_freqs), len(vocab)))
+    sparse.save_npz(os.path.join(ART_DIR, "bm25.npz"), W, compressed=False)
+    json.dump(vocab, open(os.path.join(ART_DIR, "bm25_vocab.json"), "w", encoding="utf-8"), ensure_ascii=False)
+
 def main():
     texts, meta = [], []
     for fn in os.listdir(PROC_DIR):
@@ -29,8 +118,18 @@ def main():
 
     vec = TfidfVectorizer(max_features=50000, ngram_range=(1,2), lowercase=True)
     X = vec.fit_transform(texts)
+    tfidf_df = np.bincount(X.indices, minlength=X.shape[1])
+    if TFIDF_COMPACT:
+        X_full, X = X, compact_tfidf(X)
+        queries = [m["title_sent"] for m in meta[::50] if m["title_sent"]]
+        report = compact_report(vec, X_full, X, queries)
+        json.dump(report, open(os.path.join(ART_DIR, "tfidf_report.json"), "w", encoding="utf-8"), indent=2)
+        print(f"✅ TF-IDF compacted: {report['bytes_full']/1e6:.1f}MB → {report['bytes_compact']/1e6:.1f}MB "
+              f"({report['saved_pct']}% saved), overlap@10={report['overlap_at_10']}")
+        check_report(report)
     joblib.dump(X, os.path.join(ART_DIR, "tfidf.joblib"))
     joblib.dump(vec, os.path.join(ART_DIR, "tfidf_vectorizer.joblib"))
+    export_lite_tfidf(vec, X)
     json.dump(meta, open(os.path.join(ART_DIR, "meta.json"), "w", encoding="utf-8"), ensure_ascii=False, indent=2)
     print("✅ TF-IDF built:", X.shape)
 
@@ -38,6 +137,7 @@ def main():
     bm = BM25Okapi(tokenized)
     with open(os.path.join(ART_DIR, "bm25.pkl"), "wb") as f:
         pickle.dump({"bm25": bm, "meta": meta}, f)
+    export_lite_bm25(bm)
     print("✅ BM25 built for", len(texts), "chunks")
 
     with open(os.path.join(ART_DIR, "chunks.jsonl"), "w", encoding="utf-8") as f:
@@ -46,5 +146,21 @@ def main():
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
     print("✅ Wrote artifacts/chunks.jsonl")
 
+    token_df = {}
+    for freqs in bm.doc_freqs:
+        for tok in freqs: token_df[tok] = token_df.get(tok, 0) + 1
+    bigram_df = {t: int(tfidf_df[j]) for t, j in vec.vocabulary_.items() if " " in t}
+    episode_titles = {}
+    for m in meta: episode_titles[m["episode_title"]] = episode_titles.get(m["episode_title"], 0) + 1
+    write_suggest(ART_DIR, token_df, bigram_df, episode_titles, len(texts))
+
+    evidence = {}
+    for card in load_cards(ART_DIR):
+        q = card_query(card)
+        by_tfidf = top_candidates((vec.transform([q]) @ X.T).toarray().ravel())
+        by_bm25 = top_candidates(bm.get_scores(re.findall(r"[a-z0-9]+", q.lower())))
+        evidence[card["slug"]] = [(meta[j]["chunk_id"], score) for j, score in fuse([by_tfidf, by_bm25])]
+    write_evidence(ART_DIR, evidence)
+
 if __name__ == "__main__":
     main()
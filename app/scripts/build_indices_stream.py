@@ -0,0 +1,317 @@
+# scripts/build_indices_stream.py
+# Out-of-core variant of build_indices.py for corpora larger than RAM.
+#
+# Pass 1 streams every chunk once, counting TF-IDF term/document frequencies and
+# BM25 document frequencies; counters are spilled to sorted run files whenever
+# they outgrow the memory budget and merged afterwards. Pass 2 streams the chunks
+# again and writes the TF-IDF matrix and BM25 postings block by block. Output is
+# the plain artifact set served by SERVING_MODE=lite (see build_indices.py), plus
+# meta.json and chunks.jsonl, all written incrementally.
+import os, json, re, math, heapq, shutil, tempfile, zipfile
+from array import array
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from build_suggest import write_suggest
+from build_evidence import CANDIDATES, load_cards, card_query, fuse, write_evidence
+
+PROC_DIR = "data/processed"
+ART_DIR  = "artifacts"
+
+MEMORY_MB    = int(os.environ.get("BUILD_MEMORY_MB", "256"))  # approximate working-set budget
+SPILL_DIR    = os.environ.get("BUILD_SPILL_DIR")              # defaults to the system temp dir
+MAX_FEATURES = 50000
+NGRAM_RANGE  = (1, 2)
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"  # TfidfVectorizer default
+BM25_K1, BM25_B, BM25_EPSILON = 1.5, 0.75, 0.25  # BM25Okapi defaults
+# The BM25 vocabulary (token -> column, idf) is the one structure held in memory that
+# grows with the corpus; drop tokens seen in fewer chunks than this to bound it
+# (1 keeps every token, matching BM25Okapi).
+BM25_MIN_DF = int(os.environ.get("BM25_MIN_DF", "1"))
+
+TFIDF_COMPACT    = os.environ.get("TFIDF_COMPACT", "0") == "1"
+TFIDF_MIN_WEIGHT = float(os.environ.get("TFIDF_MIN_WEIGHT", "0.057"))
+TFIDF_TOPN       = int(os.environ.get("TFIDF_TOPN", "0"))
+
+# Rough per-entry costs used to turn the budget into counter / block sizes
+COUNTER_ENTRY_BYTES = 200
+POSTING_BYTES = 24
+
+_token_re = re.compile(TOKEN_PATTERN)
+
+def tfidf_terms(text):
+    toks = _token_re.findall(text.lower())
+    terms = list(toks)
+    for n in range(max(2, NGRAM_RANGE[0]), NGRAM_RANGE[1]+1):
+        terms.extend(" ".join(toks[i:i+n]) for i in range(len(toks)-n+1))
+    return terms
+
+def bm25_tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def iter_chunks():
+    for fn in sorted(os.listdir(PROC_DIR)):
+        if not fn.endswith(".chunks.json"): continue
+        js = json.load(open(os.path.join(PROC_DIR, fn), "r", encoding="utf-8"))
+        yield from js["chunks"]
+
+# ---- Spilling counters ----
+class SpillCounter:
+    """term -> [v0, v1, ...] sums, spilled to sorted run files past max_entries."""
+    def __init__(self, spill_dir, name, width, max_entries):
+        self.spill_dir, self.name, self.width, self.max_entries = spill_dir, name, width, max_entries
+        self.counts, self.runs = {}, []
+
+    def add(self, term, *vals):
+        row = self.counts.get(term)
+        if row is None: self.counts[term] = list(vals)
+        else:
+            for i, v in enumerate(vals): row[i] += v
+        if len(self.counts) >= self.max_entries: self.spill()
+
+    def spill(self):
+        if not self.counts: return
+        path = os.path.join(self.spill_dir, f"{self.name}.{len(self.runs):05d}.run")
+        with open(path, "w", encoding="utf-8") as f:
+            for term in sorted(self.counts):
+                f.write(term + "\t" + "\t".join(map(str, self.counts[term])) + "\n")
+        self.runs.append(path); self.counts = {}
+
+    def merged(self):
+        """Yield (term, [sums]) in term order across all runs."""
+        self.spill()
+        files = [open(p, "r", encoding="utf-8") for p in self.runs]
+        def rows(f):
+            for line in f:
+                term, *vals = line.rstrip("\n").split("\t")
+                yield term, [int(v) for v in vals]
+        cur, acc = None, None
+        for term, vals in heapq.merge(*(rows(f) for f in files), key=lambda r: r[0]):
+            if term != cur:
+                if cur is not None: yield cur, acc
+                cur, acc = term, vals
+            else:
+                acc = [a + v for a, v in zip(acc, vals)]
+        if cur is not None: yield cur, acc
+        for f in files: f.close()
+
+# ---- Incremental CSR / .npz writers ----
+class CSRWriter:
+    """Appends CSR rows to raw files, then packs them into a scipy-compatible .npz."""
+    def __init__(self, spill_dir, name, n_cols, dtype):
+        self.n_cols, self.dtype = n_cols, np.dtype(dtype)
+        self.data_path = os.path.join(spill_dir, f"{name}.data")
+        self.ind_path = os.path.join(spill_dir, f"{name}.indices")
+        self.indptr_path = os.path.join(spill_dir, f"{name}.indptr")  # int64 row offsets
+        self.data_f, self.ind_f = open(self.data_path, "wb"), open(self.ind_path, "wb")
+        self.indptr_f = open(self.indptr_path, "wb")
+        self.n_rows, self.nnz, self.buffered = 0, 0, 0
+        self.buf_data, self.buf_ind, self.buf_indptr = [], [], array("q", [0])
+
+    def add_row(self, cols, vals):
+        self.buf_ind.append(np.asarray(cols, dtype=np.int32))
+        self.buf_data.append(np.asarray(vals, dtype=self.dtype))
+        self.nnz += len(cols); self.buffered += len(cols); self.n_rows += 1
+        self.buf_indptr.append(self.nnz)
+
+    def flush(self):
+        if self.buf_ind:
+            np.concatenate(self.buf_ind).tofile(self.ind_f)
+            np.concatenate(self.buf_data).tofile(self.data_f)
+        self.buf_indptr.tofile(self.indptr_f)
+        self.buf_data, self.buf_ind, self.buf_indptr, self.buffered = [], [], array("q"), 0
+
+    def block(self):
+        """The buffered (not yet flushed) rows as a CSR matrix."""
+        lens = [len(b) for b in self.buf_ind]
+        indptr = np.concatenate([[0], np.cumsum(lens)]) if lens else np.zeros(1, dtype=np.int64)
+        data = np.concatenate(self.buf_data) if lens else np.zeros(0, dtype=self.dtype)
+        ind = np.concatenate(self.buf_ind) if lens else np.zeros(0, dtype=np.int32)
+        return sparse.csr_matrix((data, ind, indptr), shape=(len(lens), self.n_cols))
+
+    def close(self, out_path):
+        self.flush(); self.data_f.close(); self.ind_f.close(); self.indptr_f.close()
+        with zipfile.ZipFile(out_path, "w", allowZip64=True) as zf:
+            _npz_stream(zf, "indices", self.ind_path, np.int32, self.nnz)
+            _npz_stream(zf, "indptr", self.indptr_path, np.int32 if self.nnz < 2**31 else np.int64,
+                        self.n_rows + 1, src_dtype=np.int64)
+            _npz_array(zf, "format", np.array("csr"))
+            _npz_array(zf, "shape", np.array((self.n_rows, self.n_cols)))
+            _npz_stream(zf, "data", self.data_path, self.dtype, self.nnz)
+        return self.n_rows, self.nnz
+
+def _npz_array(zf, name, arr):
+    with zf.open(name + ".npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, arr, allow_pickle=False)
+
+def _npz_stream(zf, name, raw_path, dtype, length, src_dtype=None):
+    """Copy a raw array file into the archive as name.npy, converting from src_dtype block by block."""
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": (length,)}
+    with zf.open(name + ".npy", "w", force_zip64=True) as f, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(f, header)
+        if src_dtype is None or np.dtype(src_dtype) == np.dtype(dtype):
+            shutil.copyfileobj(raw, f, 1 << 20)
+            return
+        while True:
+            block = np.fromfile(raw, dtype=src_dtype, count=1 << 17)
+            if not len(block): break
+            f.write(block.astype(dtype).tobytes())
+
+# ---- Build ----
+def count_pass(spill_dir, max_entries):
+    tf_counter = SpillCounter(spill_dir, "tfidf", 2, max_entries)  # term -> [corpus tf, df]
+    bm_counter = SpillCounter(spill_dir, "bm25", 1, max_entries)   # token -> [df]
+    n_docs, total_len = 0, 0
+    for ch in iter_chunks():
+        for term, c in Counter(tfidf_terms(ch["text"])).items(): tf_counter.add(term, c, 1)
+        toks = bm25_tokens(ch["text"])
+        for tok in set(toks): bm_counter.add(tok, 1)
+        n_docs += 1; total_len += len(toks)
+    return tf_counter, bm_counter, n_docs, total_len
+
+def select_tfidf_vocab(tf_counter, n_docs):
+    # Keep the MAX_FEATURES most frequent terms (corpus tf), then sort them like sklearn does
+    top = heapq.nlargest(MAX_FEATURES, ((tf, term, df) for term, (tf, df) in tf_counter.merged()))
+    top.sort(key=lambda r: r[1])
+    vocab = [term for _, term, _ in top]
+    df = np.array([d for _, _, d in top], dtype=np.float64)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1  # smooth_idf=True
+    return vocab, idf, df
+
+def bm25_idf(bm_counter, n_docs):
+    vocab, idf, dfs = [], array("d"), array("q")
+    idf_sum, n_tokens = 0.0, 0  # the negative-idf floor uses the mean over every token, pruned or not
+    for tok, (df,) in bm_counter.merged():
+        w = math.log(n_docs - df + 0.5) - math.log(df + 0.5)
+        idf_sum += w; n_tokens += 1
+        if df < BM25_MIN_DF: continue
+        vocab.append(tok); dfs.append(df); idf.append(w)
+    idf = np.frombuffer(idf, dtype=np.float64).copy()
+    if n_tokens: idf[idf < 0] = BM25_EPSILON * idf_sum / n_tokens
+    return vocab, idf, dfs
+
+def compact_row(cols, vals):
+    keep = vals >= TFIDF_MIN_WEIGHT if TFIDF_MIN_WEIGHT > 0 else np.ones(len(vals), dtype=bool)
+    cols, vals = cols[keep], vals[keep]
+    if TFIDF_TOPN > 0 and len(vals) > TFIDF_TOPN:
+        k = np.sort(np.argpartition(vals, -TFIDF_TOPN)[-TFIDF_TOPN:])
+        cols, vals = cols[k], vals[k]
+    norm = np.linalg.norm(vals)
+    return cols, (vals / norm if norm else vals)
+
+def _sparse_rows(rows, n_cols):
+    """[(cols, vals), ...] -> CSR matrix with one row per entry."""
+    indptr = np.cumsum([0] + [len(c) for c, _ in rows])
+    cols = np.concatenate([c for c, _ in rows]) if rows else np.zeros(0, dtype=np.int32)
+    vals = np.concatenate([v for _, v in rows]) if rows else np.zeros(0)
+    return sparse.csr_matrix((vals, cols, indptr), shape=(len(rows), n_cols))
+
+class EvidenceScorer:
+    """Keeps each protocol card's best CANDIDATES chunks per engine as blocks stream past."""
+    def __init__(self, cards, tf_col, tf_idf, bm_col):
+        self.slugs = [c["slug"] for c in cards]
+        tf_rows, bm_rows = [], []  # per card: (columns, values), built from the query's terms only
+        for card in cards:
+            q = card_query(card)
+            counts = Counter(j for j in map(tf_col.get, tfidf_terms(q)) if j is not None)
+            cols = np.fromiter(counts, dtype=np.int32, count=len(counts))
+            vals = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * tf_idf[cols]
+            tf_rows.append((cols, vals / (np.linalg.norm(vals) or 1)))
+            counts = Counter(j for j in map(bm_col.get, bm25_tokens(q)) if j is not None)
+            bm_rows.append((np.fromiter(counts, dtype=np.int32, count=len(counts)),
+                            np.fromiter(counts.values(), dtype=np.float64, count=len(counts))))
+        self.queries = {"tfidf": _sparse_rows(tf_rows, len(tf_idf)), "bm25": _sparse_rows(bm_rows, len(bm_col))}
+        self.heaps = {engine: [[] for _ in cards] for engine in self.queries}
+
+    def score(self, blocks, chunk_ids):
+        for engine, block in blocks.items():
+            S = (block @ self.queries[engine].T).toarray()  # block rows x cards
+            for c, heap in enumerate(self.heaps[engine]):
+                col = S[:, c]
+                for r in np.argsort(-col)[:CANDIDATES]:
+                    if col[r] <= 0: break
+                    item = (float(col[r]), chunk_ids[r])
+                    if len(heap) < CANDIDATES: heapq.heappush(heap, item)
+                    elif item > heap[0]: heapq.heapreplace(heap, item)
+
+    def evidence(self):
+        out = {}
+        for c, slug in enumerate(self.slugs):
+            rankings = [[cid for _, cid in sorted(self.heaps[e][c], reverse=True)] for e in self.heaps]
+            out[slug] = fuse(rankings)
+        return out
+
+def write_pass(spill_dir, block_nnz, tf_vocab, tf_idf, bm_vocab, bm_idf, avgdl):
+    tf_col = {t: j for j, t in enumerate(tf_vocab)}
+    bm_col = {t: j for j, t in enumerate(bm_vocab)}
+    tf_w = CSRWriter(spill_dir, "tfidf", len(tf_vocab), np.float32 if TFIDF_COMPACT else np.float64)
+    bm_w = CSRWriter(spill_dir, "bm25", len(bm_vocab), np.float32)
+    scorer = EvidenceScorer(load_cards(ART_DIR), tf_col, tf_idf, bm_col)
+    episode_titles, block_ids = {}, []
+
+    def flush():
+        scorer.score({"tfidf": tf_w.block(), "bm25": bm_w.block()}, block_ids)
+        tf_w.flush(); bm_w.flush(); block_ids.clear()
+    with open(os.path.join(ART_DIR, "meta.json"), "w", encoding="utf-8") as meta_f, \
+         open(os.path.join(ART_DIR, "chunks.jsonl"), "w", encoding="utf-8") as chunks_f:
+        meta_f.write("[")
+        for i, ch in enumerate(iter_chunks()):
+            m = {k: ch[k] for k in ("chunk_id", "episode_id", "episode_title", "chunk_index", "title_sent", "why_sent")}
+            meta_f.write(("," if i else "") + "\n" + json.dumps(m, ensure_ascii=False))
+            episode_titles[m["episode_title"]] = episode_titles.get(m["episode_title"], 0) + 1
+            rec = dict(m); rec["text"] = ch["text"]
+            chunks_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            block_ids.append(m["chunk_id"])
+
+            counts = Counter(j for j in map(tf_col.get, tfidf_terms(ch["text"])) if j is not None)
+            cols = np.fromiter(sorted(counts), dtype=np.int32, count=len(counts))
+            vals = np.array([counts[j] for j in cols], dtype=np.float64) * tf_idf[cols]
+            norm = np.linalg.norm(vals)
+            if norm: vals /= norm
+            if TFIDF_COMPACT: cols, vals = compact_row(cols, vals)
+            tf_w.add_row(cols, vals)
+
+            toks = bm25_tokens(ch["text"])
+            counts = Counter(j for j in map(bm_col.get, toks) if j is not None)
+            cols = np.fromiter(sorted(counts), dtype=np.int32, count=len(counts))
+            tf = np.array([counts[j] for j in cols], dtype=np.float64)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(toks) / avgdl)
+            bm_w.add_row(cols, bm_idf[cols] * tf * (BM25_K1 + 1) / (tf + norm))
+
+            if tf_w.buffered + bm_w.buffered >= block_nnz: flush()
+        flush()
+        meta_f.write("\n]\n")
+    write_evidence(ART_DIR, scorer.evidence())
+    return (tf_w.close(os.path.join(ART_DIR, "tfidf.npz")), bm_w.close(os.path.join(ART_DIR, "bm25.npz")),
+            episode_titles)
+
+def main():
+    os.makedirs(ART_DIR, exist_ok=True)
+    budget = MEMORY_MB << 20
+    max_entries = max(10000, budget // 2 // COUNTER_ENTRY_BYTES)
+    block_nnz = max(10000, budget // 4 // POSTING_BYTES)
+    with tempfile.TemporaryDirectory(prefix="build_indices_", dir=SPILL_DIR) as spill_dir:
+        tf_counter, bm_counter, n_docs, total_len = count_pass(spill_dir, max_entries)
+        if not n_docs:
+            print("No chunks found.")
+            return
+        print(f"✅ Pass 1: {n_docs} chunks; spilled {len(tf_counter.runs)} TF-IDF / {len(bm_counter.runs)} BM25 runs")
+        tf_vocab, tf_idf, tf_df = select_tfidf_vocab(tf_counter, n_docs)
+        bm_vocab, bm_idf, bm_df = bm25_idf(bm_counter, n_docs)
+        (rows, tf_nnz), (_, bm_nnz), episode_titles = write_pass(
+            spill_dir, block_nnz, tf_vocab, tf_idf, bm_vocab, bm_idf, total_len / n_docs)
+
+    settings = {"lowercase": True, "token_pattern": TOKEN_PATTERN, "ngram_range": list(NGRAM_RANGE),
+                "norm": "l2", "sublinear_tf": False}
+    json.dump({"settings": settings, "vocab": tf_vocab},
+              open(os.path.join(ART_DIR, "tfidf_lite.json"), "w", encoding="utf-8"), ensure_ascii=False)
+    np.save(os.path.join(ART_DIR, "tfidf_idf.npy"), tf_idf)
+    json.dump(bm_vocab, open(os.path.join(ART_DIR, "bm25_vocab.json"), "w", encoding="utf-8"), ensure_ascii=False)
+    print(f"✅ TF-IDF built: ({rows}, {len(tf_vocab)}) nnz={tf_nnz}")
+    print(f"✅ BM25 built for {rows} chunks; vocab={len(bm_vocab)} nnz={bm_nnz}")
+    print("✅ Wrote artifacts/meta.json, artifacts/chunks.jsonl (serve with SERVING_MODE=lite)")
+    write_suggest(ART_DIR, dict(zip(bm_vocab, bm_df)),
+                  {t: int(d) for t, d in zip(tf_vocab, tf_df) if " " in t}, episode_titles, n_docs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# scripts/build_recs.py
+# Materializes the /v1/recommend table (MMR lists for the known tag sets) into
+# artifacts/recs.json, so servers load it instead of warming on every start.
+# Run after build_indices.py / build_indices_stream.py; the server ignores the
+# file if the artifacts have changed since.
+import os, sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    art_dir = os.environ.get("ARTIFACTS_DIR", "artifacts")
+    # Lite artifacts are written by both builders and load without sklearn
+    if os.path.exists(os.path.join(art_dir, "tfidf_lite.json")): os.environ.setdefault("SERVING_MODE", "lite")
+    os.environ["WARM_RECS"] = "0"  # warmed explicitly below, even if a stale recs.json exists
+    sys.path.insert(0, APP_DIR)
+    from api import server  # env must be set before import
+    server.load_artifacts()
+    server.STATE["recs"] = {}
+    server.warm_recommendations()
+    server.save_recommendations()
+    print(f"✅ Recommend table: {len(server.STATE['recs'])} tag sets -> {os.path.join(art_dir, 'recs.json')}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# scripts/build_suggest.py
+# Typeahead index for /v1/suggest, written by build_indices.py / build_indices_stream.py.
+#
+# Entries are keyed by their tokenize()-normalised text and stored sorted by key,
+# so the server answers a prefix with a binary search over the key array.
+import os, re, json
+
+MIN_DF      = 2       # ignore tokens seen in fewer chunks
+MAX_BIGRAMS = 5000    # most frequent TF-IDF bigrams kept
+# Phrases that start or end with one of these make poor suggestions ("morning and", "yeah so")
+STOPWORDS = set("""a an and are as at be but by do for from has have he i if in into is it its just like
+me my not of on or so that the their then there these they this to was we what when which who will with
+you your""".split())
+# Spoken filler that transcripts are full of
+STOPWORDS |= set("yeah yes mm um uh okay ok oh well know think mean right really actually kind sort".split())
+# Kind boosts on top of the document-frequency weight (df / n_docs, in [0, 1])
+BOOST = {"term": 0.0, "phrase": 0.0, "episode": 1.0, "protocol": 2.0}
+
+def normalize(text):
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+def _title_keys(title):
+    # Index titles under every word position so "sunlight" finds "Morning Sunlight Protocol"
+    words = normalize(title).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+def build_suggest(token_df, bigram_df, episode_titles, protocols, n_docs):
+    """token_df / bigram_df: {term: df}; episode_titles: {title: n_chunks}; protocols: card dicts."""
+    entries = []  # (key, text, kind, weight)
+    for tok, df in token_df.items():
+        if df >= MIN_DF and len(tok) > 1 and tok not in STOPWORDS:
+            entries.append((tok, tok, "term", BOOST["term"] + df / n_docs))
+    phrases = {bg: df for bg, df in bigram_df.items()
+               if bg.split()[0] not in STOPWORDS and bg.split()[-1] not in STOPWORDS}
+    for bg, df in sorted(phrases.items(), key=lambda kv: -kv[1])[:MAX_BIGRAMS]:
+        if df >= MIN_DF:
+            entries.append((normalize(bg), bg, "phrase", BOOST["phrase"] + df / n_docs))
+    top_chunks = max(episode_titles.values(), default=1)
+    for title, n in episode_titles.items():
+        for key in _title_keys(title):
+            entries.append((key, title, "episode", BOOST["episode"] + n / top_chunks))
+    for card in protocols:
+        for key in _title_keys(card["title"]):
+            entries.append((key, card["title"], "protocol", BOOST["protocol"]))
+    entries = [e for e in entries if e[0]]
+    entries.sort(key=lambda e: (e[0], -e[3]))
+    return {
+        "keys": [e[0] for e in entries],
+        "text": [e[1] for e in entries],
+        "kind": [e[2] for e in entries],
+        "weight": [round(e[3], 6) for e in entries],
+    }
+
+def write_suggest(art_dir, token_df, bigram_df, episode_titles, n_docs):
+    prot_path = os.path.join(art_dir, "protocol_cards.json")
+    protocols = json.load(open(prot_path, "r", encoding="utf-8")) if os.path.exists(prot_path) else []
+    idx = build_suggest(token_df, bigram_df, episode_titles, protocols, n_docs)
+    json.dump(idx, open(os.path.join(art_dir, "suggest.json"), "w", encoding="utf-8"), ensure_ascii=False)
+    print(f"✅ Suggest index: {len(idx['keys'])} entries")
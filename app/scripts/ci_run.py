@@ -6,6 +6,10 @@ def run(cmd, input_text=None):
     res = subprocess.run(cmd, input=input_text.encode("utf-8") if input_text else None, shell=True, check=True)
 
 def main():
+    # CI serves the compact TF-IDF matrix. A missed report target only warns: the threshold is
+    # tuned on one snapshot of the corpus and must not block committing fresh artifacts.
+    os.environ.setdefault("TFIDF_COMPACT", "1")
+
     # 1) Detect changes
     out = subprocess.check_output("python scripts/manifest.py", shell=True).decode("utf-8").strip()
     info = json.loads(out) if out.startswith("{") else {"changed": [], "total": 0}
@@ -27,5 +31,8 @@ def main():
     # 3) Always rebuild TF-IDF + BM25 (fast, ensures consistency)
     run("python scripts/build_indices.py")
 
+    # 4) Materialize the /v1/recommend table so servers skip warming at startup
+    run("python scripts/build_recs.py")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,192 @@
+# scripts/load_test.py
+# Load harness for the API: a weighted endpoint mix (or a replayed request log)
+# swept over concurrency levels, reporting throughput, latency percentiles and
+# error rates per endpoint.
+#
+# By default the FastAPI app is driven in-process over ASGI against a synthetic
+# corpus built into a temp dir (temp EVENTS_DB, SERVING_MODE=lite), so it runs
+# offline. Set LOAD_TARGET=http://localhost:8000 to hit a running uvicorn.
+import os, sys, json, random, asyncio, tempfile, time
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGET      = os.environ.get("LOAD_TARGET")                       # unset -> in-process ASGI
+MIX         = os.environ.get("LOAD_MIX", "search=5,recommend=2,next=2,explain=1,events=1")
+CONCURRENCY = [int(c) for c in os.environ.get("LOAD_CONCURRENCY", "1,4,16,64").split(",")]
+REQUESTS    = int(os.environ.get("LOAD_REQUESTS", "400"))         # per concurrency level
+REPLAY      = os.environ.get("LOAD_REPLAY")                       # JSONL request log to replay
+REPORT      = os.environ.get("LOAD_REPORT")                       # optional JSON report path
+ARTIFACTS   = os.environ.get("LOAD_ARTIFACTS_DIR")                # reuse artifacts instead of generating
+SYNTH_EPISODES, SYNTH_CHUNKS = 40, 60
+SEED = 7
+
+WORDS = ("sleep circadian light morning sunlight dopamine focus attention cortisol adrenaline cold exposure "
+         "exercise zone cardio strength recovery nutrition protein fasting glucose caffeine stress breathing "
+         "memory learning neuroplasticity hormone testosterone estrogen pain gut brain vagus nerve mood").split()
+TAGS = ["sleep", "circadian", "recovery", "focus", "attention", "productivity", "energy", "metabolic", "stress"]
+
+# ---- Offline fixture ----
+def build_synthetic_artifacts(root):
+    """Synthetic chunks -> lite artifacts via the streaming builder."""
+    rng = random.Random(SEED)
+    proc_dir, art_dir = os.path.join(root, "data", "processed"), os.path.join(root, "artifacts")
+    os.makedirs(proc_dir); os.makedirs(art_dir)
+    for e in range(SYNTH_EPISODES):
+        ep_id = f"ep_synthetic_{e:03d}"
+        chunks = []
+        for i in range(SYNTH_CHUNKS):
+            sents = [" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "." for _ in range(5)]
+            chunks.append({"chunk_id": f"{ep_id}__{i:04d}", "episode_id": ep_id, "episode_title": f"Synthetic {e}",
+                           "chunk_index": i, "text": " ".join(sents), "title_sent": sents[0], "why_sent": sents[1]})
+        json.dump({"episode_id": ep_id, "title": f"Synthetic {e}", "chunks": chunks},
+                  open(os.path.join(proc_dir, f"{ep_id}.chunks.json"), "w", encoding="utf-8"))
+    cards = os.path.join(APP_DIR, "artifacts", "protocol_cards.json")
+    if os.path.exists(cards):
+        with open(cards, "rb") as src, open(os.path.join(art_dir, "protocol_cards.json"), "wb") as dst:
+            dst.write(src.read())
+    sys.path.insert(0, os.path.join(APP_DIR, "scripts"))
+    import build_indices_stream as builder
+    builder.PROC_DIR, builder.ART_DIR = proc_dir, art_dir
+    builder.main()
+    return art_dir
+
+def in_process_client(root):
+    os.environ["ARTIFACTS_DIR"] = ARTIFACTS or build_synthetic_artifacts(root)
+    os.environ["EVENTS_DB"] = os.path.join(root, "db", "events.sqlite")
+    os.environ.setdefault("SERVING_MODE", "lite")
+    sys.path.insert(0, APP_DIR)
+    from api import server  # env must be set before import
+    server.ensure_loaded(); server.db()  # ASGITransport does not run startup hooks
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)  # app errors -> 500s
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest")
+
+# ---- Request generation ----
+class Workload:
+    def __init__(self, client, rng):
+        self.client, self.rng = client, rng
+        self.weights = {k: float(v) for k, v in (p.split("=") for p in MIX.split(","))}
+        self.users = [f"load_user_{i}" for i in range(200)]
+        self.slugs, self.chunks = [], []
+        self.headers = {"x-api-key": os.environ["API_KEY"]} if os.environ.get("API_KEY") else {}
+
+    async def discover(self):
+        """Collect protocol slugs and chunk coordinates from the API itself."""
+        for _ in range(10):
+            r = await self.client.get("/v1/next", params={"user_id": "load_probe"})
+            if r.status_code == 200: self.slugs.append(r.json()["protocol_slug"])
+        r = await self.client.get("/v1/search", params={"q": "sleep focus", "limit": 50})
+        self.chunks = [(it["episode_id"], it["chunk_index"]) for it in r.json().get("items", [])]
+        self.slugs = sorted(set(self.slugs))
+
+    def next_request(self):
+        rng = self.rng
+        kind = rng.choices(list(self.weights), weights=list(self.weights.values()))[0]
+        if kind == "search":
+            q = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+            return kind, "GET", "/v1/search", {"q": q, "mode": rng.choice(["bm25", "tfidf"]), "limit": 10}, None
+        if kind == "recommend":
+            params = {"tags": rng.sample(TAGS, rng.randint(0, 3)), "topk": 10}
+            if rng.random() < 0.5: params["user_id"] = rng.choice(self.users)
+            return kind, "GET", "/v1/recommend", params, None
+        if kind == "next":
+            return kind, "GET", "/v1/next", {"user_id": rng.choice(self.users), "goals": rng.sample(TAGS, 1)}, None
+        if kind == "explain":
+            ep, idx = rng.choice(self.chunks) if self.chunks else ("missing", 0)
+            return kind, "GET", "/v1/explain", {"episode_id": ep, "chunk_index": idx}, None
+        if kind == "events":
+            body = {"user_id": rng.choice(self.users), "event": rng.choice(["completed", "like", "skip"]),
+                    "protocol_slug": rng.choice(self.slugs) if self.slugs else None}
+            return kind, "POST", "/v1/events", None, body
+        raise ValueError(f"unknown endpoint in LOAD_MIX: {kind}")
+
+def route_templates():
+    """(compiled path regex, template) for every API route, e.g. /v1/users/{user_id}."""
+    if APP_DIR not in sys.path: sys.path.insert(0, APP_DIR)
+    from api import server  # importing does not load artifacts
+    return [(r.path_regex, r.path) for r in server.app.routes if hasattr(r, "path_regex")]
+
+def replay_kind(method, path, templates):
+    path = path.split("?")[0]
+    for regex, template in templates:
+        if regex.match(path): return f"{method} {template}"
+    return f"{method} {path}"  # not an API route; reported on its own
+
+def load_replay(path):
+    """Lines of {"method": "GET", "path": "/v1/search?q=sleep", "params": {...}, "json": {...}}.
+    Requests are grouped by method + route template, so /v1/users/a and /v1/users/b share a row."""
+    reqs, templates = [], route_templates()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip(): continue
+            rec = json.loads(line)
+            method = rec.get("method", "GET").upper()
+            reqs.append((replay_kind(method, rec["path"], templates), method, rec["path"], rec.get("params"), rec.get("json")))
+    return reqs
+
+# ---- Driver ----
+def percentile(sorted_vals, p):
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(len(sorted_vals)-1, int(round(p / 100 * (len(sorted_vals)-1))))]
+
+async def run_level(client, requests, concurrency, headers):
+    queue = asyncio.Queue()
+    for r in requests: queue.put_nowait(r)
+    samples = []  # (kind, seconds, ok)
+
+    async def worker():
+        while True:
+            try: kind, method, path, params, body = queue.get_nowait()
+            except asyncio.QueueEmpty: return
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, path, params=params, json=body, headers=headers)
+                ok = r.status_code < 500 and r.status_code not in (401, 422)
+            except httpx.HTTPError:
+                ok = False
+            samples.append((kind, time.perf_counter() - t0, ok))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - t0
+
+def summarize(samples, wall):
+    out = {}
+    for kind in sorted({s[0] for s in samples}) + ["ALL"]:
+        rows = [s for s in samples if kind == "ALL" or s[0] == kind]
+        lat = sorted(s[1] * 1000 for s in rows)
+        out[kind] = {"n": len(rows), "rps": len(rows) / wall if wall else 0.0,
+                     "p50_ms": percentile(lat, 50), "p95_ms": percentile(lat, 95), "p99_ms": percentile(lat, 99),
+                     "error_rate": sum(not s[2] for s in rows) / len(rows) if rows else 0.0}
+    return out
+
+async def main_async(root):
+    client = httpx.AsyncClient(base_url=TARGET, timeout=30) if TARGET else in_process_client(root)
+    rng = random.Random(SEED)
+    async with client:
+        work = Workload(client, rng)
+        await work.discover()
+        replay = load_replay(REPLAY) if REPLAY else None
+        report = {"target": TARGET or "asgi", "levels": {}}
+        for c in CONCURRENCY:
+            reqs = [replay[i % len(replay)] for i in range(REQUESTS)] if replay else \
+                   [work.next_request() for _ in range(REQUESTS)]
+            samples, wall = await run_level(client, reqs, c, work.headers)
+            stats = summarize(samples, wall)
+            report["levels"][c] = stats
+            print(f"\n== concurrency={c}  requests={len(samples)}  wall={wall:.2f}s")
+            w = max(10, *map(len, stats))
+            print(f"{'endpoint':{w}s} {'n':>6s} {'rps':>8s} {'p50ms':>8s} {'p95ms':>8s} {'p99ms':>8s} {'err%':>6s}")
+            for kind, s in stats.items():
+                print(f"{kind:{w}s} {s['n']:6d} {s['rps']:8.1f} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} "
+                      f"{s['p99_ms']:8.2f} {100*s['error_rate']:6.2f}")
+        if REPORT:
+            json.dump(report, open(REPORT, "w", encoding="utf-8"), indent=2)
+            print(f"\n✅ Wrote {REPORT}")
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="load_test_") as root:
+        asyncio.run(main_async(root))
+
+if __name__ == "__main__":
+    main()
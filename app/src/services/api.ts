@@ -18,6 +18,17 @@ export interface SearchResponse {
   count: number;
 }
 
+export interface SuggestItem {
+  text: string;
+  kind: 'term' | 'phrase' | 'episode' | 'protocol';
+  weight: number;
+}
+
+export interface SuggestResponse {
+  prefix: string;
+  items: SuggestItem[];
+}
+
 export interface RecommendResponse {
   items: SearchItem[];
   reasons: string[];
@@ -38,6 +49,12 @@ export interface TodayProtocol {
     episode_id: string;
     chunk_index: number;
   };
+  evidence?: SearchItem[];
+}
+
+export interface ProtocolEvidenceResponse {
+  protocol_slug: string;
+  items: SearchItem[];
 }
 
 export interface UserProfile {
@@ -114,6 +131,12 @@ class ApiService {
     return this.request(`/v1/search?${params}`);
   }
 
+  // Typeahead suggestions for a partially typed query
+  async suggest(prefix: string, limit: number = 8): Promise<SuggestResponse> {
+    const params = new URLSearchParams({ prefix, limit: limit.toString() });
+    return this.request(`/v1/suggest?${params}`);
+  }
+
   // Get personalized recommendations
   async recommend(
     tags: string[] = [],
@@ -137,6 +160,15 @@ class ApiService {
     return this.request(`/v1/next?${params}`);
   }
 
+  // Precomputed supporting transcript passages for a protocol card
+  async getProtocolEvidence(
+    slug: string,
+    limit: number = 5
+  ): Promise<ProtocolEvidenceResponse> {
+    const params = new URLSearchParams({ limit: limit.toString() });
+    return this.request(`/v1/protocols/${encodeURIComponent(slug)}/evidence?${params}`);
+  }
+
   // Explain why a result is relevant
   async explain(
     episodeId: string,
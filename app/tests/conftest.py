@@ -0,0 +1,30 @@
+# tests/conftest.py
+# Shared fixture: a small synthetic corpus built into a temp dir with the streaming
+# builder (lite artifacts, no sklearn), served by api.server against a temp EVENTS_DB.
+import os, sys
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "scripts"))
+
+@pytest.fixture(scope="session")
+def artifacts(tmp_path_factory):
+    import load_test
+    load_test.SYNTH_EPISODES, load_test.SYNTH_CHUNKS = 8, 20
+    return load_test.build_synthetic_artifacts(str(tmp_path_factory.mktemp("corpus")))
+
+@pytest.fixture
+def server(artifacts, tmp_path, monkeypatch):
+    from api import server
+    monkeypatch.setattr(server, "ART_DIR", artifacts)
+    monkeypatch.setattr(server, "DB_PATH", str(tmp_path / "events.sqlite"))
+    monkeypatch.setattr(server, "SERVING_MODE", "lite")
+    monkeypatch.setattr(server, "WARM_RECS", False)
+    server.load_artifacts()
+    return server
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+    return TestClient(server.app)
@@ -0,0 +1,20 @@
+# tests/test_next.py
+import pytest
+
+@pytest.mark.parametrize("event", ["skip", "completed", "like"])
+def test_next_after_a_single_event(client, server, event):
+    slug = server.STATE["protocols"][0]["slug"]
+    r = client.post("/v1/events", json={"user_id": "b1", "event": event, "protocol_slug": slug})
+    assert r.status_code == 200
+    for _ in range(20):  # every card is drawn on each call, including the one with counts (0,1)/(1,0)
+        r = client.get("/v1/next", params={"user_id": "b1"})
+        assert r.status_code == 200
+        assert r.json()["protocol_slug"] in {p["slug"] for p in server.STATE["protocols"]}
+
+def test_thompson_sample_treats_stored_counts_as_observations(server, monkeypatch):
+    draws = {}
+    monkeypatch.setattr(server, "bandit_scores", lambda user_id: {"a": (3, 0), "b": (0, 2)})
+    import random
+    monkeypatch.setattr(random, "betavariate", lambda a, b: draws.setdefault((a, b), 0.5))
+    server.thompson_sample("b2", [{"slug": "a"}, {"slug": "b"}, {"slug": "c"}])
+    assert set(draws) == {(4, 1), (1, 3), (1, 1)}  # Beta(1,1) prior + successes/failures
@@ -0,0 +1,24 @@
+# tests/test_recommend.py
+import pytest
+
+@pytest.mark.parametrize("topk", [-1, 0, 51])
+def test_topk_out_of_range_is_rejected(client, topk):
+    assert client.get("/v1/recommend", params={"topk": topk}).status_code == 422
+
+def test_topk_bounds(client):
+    assert len(client.get("/v1/recommend", params={"topk": 1}).json()["items"]) == 1
+    assert len(client.get("/v1/recommend", params={"topk": 50}).json()["items"]) == 50
+
+def test_recs_table_round_trip(server):
+    server.warm_recommendations()
+    table = dict(server.STATE["recs"])
+    server.save_recommendations()
+    server.STATE["recs"] = {}
+    assert server.load_recommendations()
+    assert server.STATE["recs"].keys() == table.keys()
+    assert all(server.STATE["recs"][k][0] == table[k][0] for k in table)
+
+def test_stale_recs_table_is_ignored(server):
+    server.save_recommendations()
+    server.STATE["recs_version"] = "rebuilt"
+    assert not server.load_recommendations()
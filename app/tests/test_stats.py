@@ -0,0 +1,81 @@
+# tests/test_stats.py
+import datetime
+import pytest
+
+def days_ago(n):
+    return (datetime.date.today() - datetime.timedelta(days=n)).isoformat()
+
+def post(client, user_id, event, day, slug="morning-sunlight", score=None):
+    r = client.post("/v1/events", json={"user_id": user_id, "event": event, "protocol_slug": slug,
+                                        "score": score, "ts": f"{day}T08:00:00Z"})
+    assert r.status_code == 200
+
+def test_streak_in_order(client):
+    for n in (3, 2, 1, 0):
+        post(client, "s1", "completed", days_ago(n))
+    stats = client.get("/v1/users/s1/stats").json()
+    assert (stats["current_streak"], stats["longest_streak"], stats["completed"]) == (4, 4, 4)
+    assert stats["last_day"] == days_ago(0)
+
+def test_streak_with_late_completion(client):
+    post(client, "s2", "completed", days_ago(0))
+    post(client, "s2", "completed", days_ago(1))   # synced late
+    stats = client.get("/v1/users/s2/stats").json()
+    assert (stats["current_streak"], stats["longest_streak"]) == (2, 2)
+    assert stats["last_day"] == days_ago(0)
+
+def test_late_completion_bridges_a_gap(client):
+    for n in (4, 3, 1, 0):
+        post(client, "s3", "completed", days_ago(n))
+    post(client, "s3", "completed", days_ago(2))
+    stats = client.get("/v1/users/s3/stats").json()
+    assert (stats["current_streak"], stats["longest_streak"], stats["completed"]) == (5, 5, 5)
+
+def test_broken_streak_is_not_current(client):
+    post(client, "s4", "completed", days_ago(5))
+    post(client, "s4", "completed", days_ago(4))
+    stats = client.get("/v1/users/s4/stats").json()
+    assert (stats["current_streak"], stats["longest_streak"]) == (0, 2)
+
+def test_user_stats_day_counts(client):
+    post(client, "s5", "completed", days_ago(0))
+    post(client, "s5", "skip", days_ago(0))
+    post(client, "s5", "like", days_ago(10))       # outside the default 7-day window
+    days = client.get("/v1/users/s5/stats").json()["days"]
+    assert days == [{"day": days_ago(0), "counts": {"completed": 1, "skip": 1}}]
+    assert len(client.get("/v1/users/s5/stats", params={"days": 30}).json()["days"]) == 2
+
+def test_protocol_stats_counts(client):
+    post(client, "p1", "completed", days_ago(0), slug="cold-exposure")
+    post(client, "p2", "completed", days_ago(1), slug="cold-exposure")
+    post(client, "p1", "skip", days_ago(0), slug="cold-exposure")
+    rows = {(r["protocol_slug"], r["event"]): r for r in client.get("/v1/stats/protocols").json()}
+    assert rows[("cold-exposure", "completed")]["count"] == 2
+    assert rows[("cold-exposure", "skip")]["count"] == 1
+
+def test_compact_rejects_non_positive_retention(server, client):
+    post(client, "c1", "completed", days_ago(0))
+    for days in (0, -5):
+        assert client.post("/v1/admin/compact", params={"retain_days": days}).status_code == 422
+    con = server.db()
+    assert con.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 1
+    con.close()
+    with pytest.raises(ValueError):
+        server.compact_events(0)
+
+def test_compact_drops_only_old_events(server, client):
+    post(client, "c2", "completed", days_ago(0))
+    post(client, "c2", "completed", days_ago(30))
+    r = client.post("/v1/admin/compact", params={"retain_days": 7}).json()
+    assert r["deleted"] == 1
+    assert client.get("/v1/users/c2/stats").json()["completed"] == 2  # rollups keep the history
+
+def test_protocol_stats_average_only_scored_events(client):
+    post(client, "p3", "completed", days_ago(0), slug="nsdr", score=4.0)
+    post(client, "p4", "completed", days_ago(0), slug="nsdr")
+    post(client, "p5", "completed", days_ago(1), slug="nsdr", score=2.0)
+    post(client, "p3", "like", days_ago(0), slug="nsdr")
+    rows = {(r["protocol_slug"], r["event"]): r for r in client.get("/v1/stats/protocols").json()}
+    assert rows[("nsdr", "completed")]["count"] == 3
+    assert rows[("nsdr", "completed")]["avg_score"] == 3.0
+    assert rows[("nsdr", "like")]["avg_score"] is None
@@ -0,0 +1,73 @@
+# tests/test_user_vectors.py
+import numpy as np
+
+def post_event(client, user_id, event, slug):
+    r = client.post("/v1/events", json={"user_id": user_id, "event": event, "protocol_slug": slug})
+    assert r.status_code == 200
+
+def stored_row(server, user_id):
+    con = server.db()
+    row = con.execute("SELECT n_events, last_id FROM user_vector WHERE user_id=?", (user_id,)).fetchone()
+    con.close()
+    return row
+
+def expected_vector(server, events):
+    vec = None
+    for event, slug in events:
+        vec, _ = server._apply_event(vec, event, slug)
+    return vec.toarray().ravel()
+
+def test_first_event_applied_once(server, client):
+    slug = server.STATE["protocols"][0]["slug"]
+    post_event(client, "u1", "like", slug)
+    prefs = server.STATE["users"]["u1"]
+    assert prefs["n_events"] == 1
+    assert np.allclose(prefs["vec"].toarray().ravel(), expected_vector(server, [("like", slug)]))
+    assert stored_row(server, "u1")[0] == 1
+
+def test_version_change_replays_each_event_once(server, client):
+    slugs = [p["slug"] for p in server.STATE["protocols"][:2]]
+    post_event(client, "u2", "completed", slugs[0])
+    post_event(client, "u2", "like", slugs[1])
+    server.STATE["version"] = "rebuilt"
+    server.STATE["users"].clear()
+    post_event(client, "u2", "skip", slugs[0])
+    prefs = server.STATE["users"]["u2"]
+    assert prefs["n_events"] == 3
+    want = expected_vector(server, [("completed", slugs[0]), ("like", slugs[1]), ("skip", slugs[0])])
+    assert np.allclose(prefs["vec"].toarray().ravel(), want)
+    assert stored_row(server, "u2") == (3, prefs["last_id"])
+
+def test_stale_worker_cache_does_not_overwrite_newer_row(server, client):
+    slugs = [p["slug"] for p in server.STATE["protocols"][:3]]
+    post_event(client, "u3", "completed", slugs[0])
+    stale = server.STATE["users"]["u3"]           # this worker's cached copy
+    server.STATE["users"].clear()                 # another worker handles the next event
+    post_event(client, "u3", "like", slugs[1])
+    server.STATE["users"]["u3"] = stale           # back on the first worker, cache now stale
+    post_event(client, "u3", "like", slugs[2])
+    prefs = server.STATE["users"]["u3"]
+    assert prefs["n_events"] == 3 and stored_row(server, "u3")[0] == 3
+    want = expected_vector(server, [("completed", slugs[0]), ("like", slugs[1]), ("like", slugs[2])])
+    assert np.allclose(prefs["vec"].toarray().ravel(), want)
+
+def test_profile_tags_patched_elsewhere_are_seen(server, client):
+    client.get("/v1/recommend", params={"user_id": "u4"})
+    con = server.db()                             # PATCH served by another worker
+    con.execute("INSERT INTO user_profile(user_id,goals,tags) VALUES('u4','','sleep,recovery')")
+    con.commit(); con.close()
+    r = client.get("/v1/recommend", params={"user_id": "u4"})
+    assert "tags:sleep,recovery" in r.json()["reasons"]
+
+def test_conflicting_write_is_retried(server, client, monkeypatch):
+    slugs = [p["slug"] for p in server.STATE["protocols"][:2]]
+    post_event(client, "u5", "completed", slugs[0])
+    fold = server._fold_events
+    def racing_fold(user_id, prefs, upto_id=None):
+        # Another worker folds and stores the same events between our read and write
+        monkeypatch.setattr(server, "_fold_events", fold)
+        server._load_prefs(user_id)
+        return fold(user_id, prefs, upto_id)
+    monkeypatch.setattr(server, "_fold_events", racing_fold)
+    post_event(client, "u5", "like", slugs[1])
+    assert server.STATE["users"]["u5"]["n_events"] == 2 and stored_row(server, "u5")[0] == 2